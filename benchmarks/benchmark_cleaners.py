@@ -0,0 +1,63 @@
+import argparse
+import random
+import time
+import timeit
+
+from core_data_modules.logging import Logger
+from core_data_modules.traced_data import Metadata, TracedData
+
+from src import AutoCode
+
+Logger.set_project_name("WorldBank-PLR")
+log = Logger(__name__)
+
+LOCATION_ANSWERS = ["mogadishu", "muqdisho", "hodan", "waberi", "wadajir", "baidoa", "baydhabo", "kismayo",
+                    "kismaayo", "galkacyo", "garowe", "hargeisa", "beledweyne", "dhusamareb", "jowhar", "afgoye"]
+GENDER_ANSWERS = ["male", "female", "lab", "dhedig", "rag", "naag", "waxaan ahay lab", "gabar"]
+
+
+def make_messages(rng, messages, distinct_answers):
+    """
+    :return: Synthetic TracedData with location, gender and age answers. Each answer type has about
+             `distinct_answers` distinct values, made by adding typo-like suffixes to a small set of real answers.
+    :rtype: list of TracedData
+    """
+    def answer(base_answers):
+        text = rng.choice(base_answers)
+        variant = rng.randrange(distinct_answers // len(base_answers) + 1)
+        return text if variant == 0 else f"{text} {variant}"
+
+    data = []
+    for i in range(messages):
+        data.append(TracedData(
+            {
+                "uid": f"uid-{i}",
+                "location_raw": answer(LOCATION_ANSWERS),
+                "gender_raw": answer(GENDER_ANSWERS),
+                "age_raw": str(rng.randrange(10, 100)) if rng.random() < 0.8 else f"{rng.randrange(10, 100)} sano"
+            },
+            Metadata("benchmark", Metadata.get_call_location(), time.time())
+        ))
+    return data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times AutoCode.run_cleaners on synthetic location, gender and age "
+                                                 "answers, in this process and in a pool of worker processes")
+
+    parser.add_argument("--messages", type=int, default=50000,
+                        help="Number of synthetic messages to clean")
+    parser.add_argument("--distinct-answers", type=int, default=2000,
+                        help="Approximate number of distinct answers of each type")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4],
+                        help="Numbers of worker processes to time the cleaners with")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed for the random generator of the synthetic data")
+
+    args = parser.parse_args()
+
+    for processes in args.processes:
+        # Regenerate the data for each measurement, because run_cleaners adds the cleaned labels to it in place.
+        data = make_messages(random.Random(args.seed), args.messages, args.distinct_answers)
+        seconds = timeit.timeit(lambda: AutoCode.run_cleaners("benchmark", data, processes), number=1)
+        log.info(f"{processes} process(es): {seconds:.3f}s for {args.messages} messages")
@@ -0,0 +1,66 @@
+import argparse
+import random
+import time
+import timeit
+
+from core_data_modules.cleaners import Codes
+from core_data_modules.logging import Logger
+from core_data_modules.traced_data import Metadata, TracedData
+from core_data_modules.traced_data.util import FoldTracedData
+
+from src.lib import FoldTools
+
+Logger.set_project_name("WorldBank-PLR")
+log = Logger(__name__)
+
+EQUAL_KEYS = ["uid", "gender", "age"]
+CONCAT_KEYS = ["rqa_s01_raw", "rqa_s02_raw"]
+MATRIX_KEYS = [f"rqa_reasons_{i}" for i in range(40)]
+BOOL_KEYS = ["consent_withdrawn"]
+BINARY_KEYS = ["have_voice"]
+
+
+def make_messages(rng, messages, uids):
+    """
+    :return: Synthetic messages from `uids` respondents, with a value for each fold key.
+    :rtype: list of TracedData
+    """
+    data = []
+    for i in range(messages):
+        uid = rng.randrange(uids)
+        d = {
+            "uid": f"uid-{uid}",
+            "gender": ["male", "female"][uid % 2],
+            "age": str(uid % 50),
+            "consent_withdrawn": Codes.FALSE,
+            rng.choice(CONCAT_KEYS): f"message {i}",
+            "have_voice": rng.choice([Codes.YES, Codes.NO, Codes.NOT_CODED])
+        }
+        for key in MATRIX_KEYS:
+            d[key] = Codes.MATRIX_1 if rng.random() < 0.05 else Codes.MATRIX_0
+        data.append(TracedData(d, Metadata("benchmark", Metadata.get_call_location(), time.time())))
+    return data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times FoldTools.fold_iterable_of_traced_data against "
+                                                 "FoldTracedData.fold_iterable_of_traced_data on synthetic messages")
+
+    parser.add_argument("--messages", type=int, default=60000,
+                        help="Number of synthetic messages to fold")
+    parser.add_argument("--uids", type=int, default=15000,
+                        help="Number of respondents the synthetic messages are from")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed for the random generator of the synthetic data")
+
+    args = parser.parse_args()
+
+    data = make_messages(random.Random(args.seed), args.messages, args.uids)
+    for name, fold in [("FoldTracedData", FoldTracedData.fold_iterable_of_traced_data),
+                       ("FoldTools", FoldTools.fold_iterable_of_traced_data)]:
+        seconds = timeit.timeit(
+            lambda: fold("benchmark", data, lambda td: td["uid"], equal_keys=EQUAL_KEYS, concat_keys=CONCAT_KEYS,
+                         matrix_keys=MATRIX_KEYS, bool_keys=BOOL_KEYS, binary_keys=BINARY_KEYS),
+            number=1
+        )
+        log.info(f"{name}: {seconds:.3f}s to fold {args.messages} messages from {args.uids} uids")
@@ -0,0 +1,78 @@
+import argparse
+import random
+import time
+import timeit
+from collections import Counter
+
+from core_data_modules.logging import Logger
+from core_data_modules.traced_data import Metadata, TracedData
+
+from src.lib import PipelineConfiguration
+from src.lib.pipeline_configuration import CodeSchemes
+from src.ws_correction import WSCorrection, _WSCorrectionPlanTables
+
+Logger.set_project_name("WorldBank-PLR")
+log = Logger(__name__)
+
+
+def make_uid_group(rng, uid, survey_fields_present, rqa_messages, move_probability):
+    """
+    :return: Synthetic TracedData for one uid, with a 'WS - Correct Dataset' label on every raw field present.
+    :rtype: list of TracedData
+    """
+    plan_registry = PipelineConfiguration.PLAN_REGISTRY
+    ws_codes = [plan.ws_code for plan in plan_registry.all_plans if plan.ws_code is not None]
+    not_moving_code = CodeSchemes.WS_CORRECT_DATASET.get_code_with_control_code("NR")
+
+    def ws_label():
+        code = rng.choice(ws_codes) if rng.random() < move_probability else not_moving_code
+        return {"SchemeID": CodeSchemes.WS_CORRECT_DATASET.scheme_id, "CodeID": code.code_id}
+
+    survey = {"uid": uid}
+    for plan in [plan for plan in plan_registry.survey_plans if plan.coda_filename is not None][:survey_fields_present]:
+        survey[plan.raw_field] = "survey answer"
+        survey[plan.time_field] = "2020-01-01T00:00:00+00:00"
+        survey[f"{plan.raw_field}_WS_correct_dataset"] = ws_label()
+
+    group = []
+    for i in range(rqa_messages):
+        d = dict(survey)
+        for plan in plan_registry.rqa_plans:
+            d[plan.raw_field] = f"rqa message {i}"
+            d[plan.time_field] = "2020-02-01T00:00:00+00:00"
+            d[f"{plan.raw_field}_WS_correct_dataset"] = ws_label()
+        group.append(TracedData(d, Metadata("benchmark", Metadata.get_call_location(), time.time())))
+    return group
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times the WS correction of synthetic uid groups, for increasing "
+                                                 "numbers of survey fields present per uid")
+
+    parser.add_argument("--uids", type=int, default=2000,
+                        help="Number of synthetic uids to correct per measurement")
+    parser.add_argument("--rqa-messages-per-uid", type=int, default=3,
+                        help="Number of RQA messages sent by each synthetic uid")
+    parser.add_argument("--move-probability", type=float, default=0.2,
+                        help="Probability that each message is labelled as belonging to another dataset")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed for the random generator of the synthetic data")
+
+    args = parser.parse_args()
+
+    plan_tables = _WSCorrectionPlanTables()
+    max_survey_fields = len(plan_tables.survey_coda_plans)
+    for survey_fields_present in sorted({0, max_survey_fields // 2, max_survey_fields}):
+        rng = random.Random(args.seed)
+        groups = [make_uid_group(rng, f"uid-{i}", survey_fields_present, args.rqa_messages_per_uid,
+                                 args.move_probability)
+                  for i in range(args.uids)]
+
+        # _correct_uid_group updates the groups in place, so each measurement makes a single pass over fresh data.
+        def correct_all():
+            for group in groups:
+                WSCorrection._correct_uid_group("benchmark", group, plan_tables, Counter())
+
+        seconds = timeit.timeit(correct_all, number=1)
+        log.info(f"{survey_fields_present}/{max_survey_fields} survey fields present: "
+                 f"{seconds * 1e6 / args.uids:.1f}us per uid ({seconds:.3f}s for {args.uids} uids)")
@@ -14,6 +14,13 @@ while [[ $# -gt 0 ]]; do
             PROFILE_MEMORY=true
             MEMORY_PROFILE_OUTPUT_PATH="$2"
             shift 2;;
+        --incremental-coda-export)
+            INCREMENTAL_CODA_EXPORT_ARG="--incremental-coda-export"
+            shift 1;;
+        --dataset-statistics-output-path)
+            OUTPUT_DATASET_STATISTICS_JSON="$2"
+            DATASET_STATISTICS_ARG="--dataset-statistics-output-path /data/output-dataset-statistics.json"
+            shift 2;;
         --)
             shift
             break;;
@@ -26,7 +33,8 @@ done
 # Check that the correct number of arguments were provided.
 if [[ $# -ne 12 ]]; then
     echo "Usage: ./docker-run.sh
-    [--profile-cpu <profile-output-path>] [--profile-memory <profile-output-path>]
+    [--profile-cpu <profile-output-path>] [--profile-memory <profile-output-path>] [--incremental-coda-export]
+    [--dataset-statistics-output-path <dataset-statistics-output-path>]
     <user> <google-cloud-credentials-file-path> <pipeline-configuration-file-path>
     <raw-data-dir> <prev-coded-dir> <messages-json-output-path> <individuals-json-output-path>
     <icr-output-dir> <coded-output-dir> <messages-output-csv> <individuals-output-csv> <production-output-csv>"
@@ -58,7 +66,7 @@ fi
 if [[ "$PROFILE_MEMORY" = true ]]; then
     PROFILE_MEMORY_CMD="mprof run -o /data/memory.prof"
 fi
-CMD="pipenv run $PROFILE_CPU_CMD $PROFILE_MEMORY_CMD python -u generate_outputs.py \
+CMD="pipenv run $PROFILE_CPU_CMD $PROFILE_MEMORY_CMD python -u generate_outputs.py $INCREMENTAL_CODA_EXPORT_ARG $DATASET_STATISTICS_ARG \
     \"$USER\" /credentials/google-cloud-credentials.json /data/pipeline_configuration.json \
     /data/raw-data /data/prev-coded \
     /data/output-messages.jsonl /data/output-individuals.jsonl /data/output-icr /data/coded \
@@ -99,6 +107,11 @@ docker cp "$container:/data/output-messages.csv" "$OUTPUT_MESSAGES_CSV"
 mkdir -p "$(dirname "$OUTPUT_INDIVIDUALS_CSV")"
 docker cp "$container:/data/output-individuals.csv" "$OUTPUT_INDIVIDUALS_CSV"
 
+if [[ -n "$OUTPUT_DATASET_STATISTICS_JSON" ]]; then
+    mkdir -p "$(dirname "$OUTPUT_DATASET_STATISTICS_JSON")"
+    docker cp "$container:/data/output-dataset-statistics.json" "$OUTPUT_DATASET_STATISTICS_JSON"
+fi
+
 if [[ "$PROFILE_CPU" = true ]]; then
     mkdir -p "$(dirname "$CPU_PROFILE_OUTPUT_PATH")"
     docker cp "$container:/data/cpu.prof" "$CPU_PROFILE_OUTPUT_PATH"
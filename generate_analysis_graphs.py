@@ -4,15 +4,13 @@ import json
 from collections import OrderedDict
 
 import altair
-from core_data_modules.cleaners import Codes
 from core_data_modules.logging import Logger
 from core_data_modules.traced_data.io import TracedDataJsonIO
 from core_data_modules.util import IOUtils
 from storage.google_cloud import google_cloud_utils
 from storage.google_drive import drive_client_wrapper
 
-from src.lib import PipelineConfiguration
-from src.lib.pipeline_configuration import CodingModes
+from src.lib import PipelineConfiguration, AnalysisTable
 
 Logger.set_project_name("WorldBank-PLR")
 log = Logger(__name__)
@@ -70,16 +68,17 @@ if __name__ == "__main__":
         individuals = TracedDataJsonIO.import_jsonl_to_traced_data_iterable(f)
     log.info(f"Loaded {len(individuals)} individuals")
 
+    # Build columnar tables of the datasets, so that the counts below can be vectorised
+    log.info("Building analysis tables...")
+    messages_table = AnalysisTable.from_analysis_traced_data(messages, PipelineConfiguration.PLAN_REGISTRY.rqa_plans)
+    individuals_table = AnalysisTable.from_analysis_traced_data(
+        individuals, PipelineConfiguration.PLAN_REGISTRY.all_plans)
+
     # Compute the number of messages in each show and graph
     log.info(f"Graphing the number of messages received in response to each show...")
     messages_per_show = OrderedDict()  # Of radio show index to messages count
-    for plan in PipelineConfiguration.RQA_CODING_PLANS:
-        messages_per_show[plan.raw_field] = 0
-
-    for msg in messages:
-        for plan in PipelineConfiguration.RQA_CODING_PLANS:
-            if msg.get(plan.raw_field, "") != "" and msg["consent_withdrawn"] == "false":
-                messages_per_show[plan.raw_field] += 1
+    for plan in PipelineConfiguration.PLAN_REGISTRY.rqa_plans:
+        messages_per_show[plan.raw_field] = messages_table.count_raw_field_present(plan.raw_field)
 
     chart = altair.Chart(
         altair.Data(values=[{"show": k, "count": v} for k, v in messages_per_show.items()])
@@ -95,13 +94,8 @@ if __name__ == "__main__":
     # Compute the number of individuals in each show and graph
     log.info(f"Graphing the number of individuals who responded to each show...")
     individuals_per_show = OrderedDict()  # Of radio show index to individuals count
-    for plan in PipelineConfiguration.RQA_CODING_PLANS:
-        individuals_per_show[plan.raw_field] = 0
-
-    for ind in individuals:
-        for plan in PipelineConfiguration.RQA_CODING_PLANS:
-            if ind.get(plan.raw_field, "") != "" and ind["consent_withdrawn"] == "false":
-                individuals_per_show[plan.raw_field] += 1
+    for plan in PipelineConfiguration.PLAN_REGISTRY.rqa_plans:
+        individuals_per_show[plan.raw_field] = individuals_table.count_raw_field_present(plan.raw_field)
 
     chart = altair.Chart(
         altair.Data(values=[{"show": k, "count": v} for k, v in individuals_per_show.items()])
@@ -115,7 +109,7 @@ if __name__ == "__main__":
     chart.save(f"{output_dir}/individuals_per_show.png", scale_factor=IMG_SCALE_FACTOR)
 
     # Plot the per-season distribution of responses for each survey question, per individual
-    for plan in PipelineConfiguration.RQA_CODING_PLANS + PipelineConfiguration.SURVEY_CODING_PLANS:
+    for plan in PipelineConfiguration.PLAN_REGISTRY.all_plans:
         for cc in plan.coding_configurations:
             if cc.analysis_file_key is None:
                 continue
@@ -124,16 +118,8 @@ if __name__ == "__main__":
             label_counts = OrderedDict()
             for code in cc.code_scheme.codes:
                 label_counts[code.string_value] = 0
-
-            if cc.coding_mode == CodingModes.SINGLE:
-                for ind in individuals:
-                    label_counts[ind[cc.analysis_file_key]] += 1
-            else:
-                assert cc.coding_mode == CodingModes.MULTIPLE
-                for ind in individuals:
-                    for code in cc.code_scheme.codes:
-                        if ind[f"{cc.analysis_file_key}{code.string_value}"] == Codes.MATRIX_1:
-                            label_counts[code.string_value] += 1
+            for code, count in zip(cc.code_scheme.codes, individuals_table.count_codes(cc)):
+                label_counts[code.string_value] += int(count)
 
             chart = altair.Chart(
                 altair.Data(values=[{"label": k, "count": v} for k, v in label_counts.items()])
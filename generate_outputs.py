@@ -1,6 +1,7 @@
 import argparse
 import json
 import os
+import resource
 
 from core_data_modules.logging import Logger
 from core_data_modules.traced_data.io import TracedDataJsonIO
@@ -8,13 +9,23 @@ from core_data_modules.util import IOUtils
 from storage.google_cloud import google_cloud_utils
 from storage.google_drive import drive_client_wrapper
 
-from src import CombineRawDatasets, TranslateRapidProKeys, AutoCode, ProductionFile, \
-    ApplyManualCodes, AnalysisFile, WSCorrection
-from src.lib import PipelineConfiguration
+from src import LoadRawData, AutoCode, ProductionFile, ApplyManualCodes, AnalysisFile, WSCorrection
+from src.lib import PipelineConfiguration, CodaDatasets, MessageIdCache, DatasetStatistics
 
 Logger.set_project_name("WorldBank-PLR")
 log = Logger(__name__)
 
+
+def positive_int(value):
+    """
+    Argument type for options which must be an integer of at least 1, such as the number of worker processes to use.
+    """
+    int_value = int(value)
+    if int_value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, but was {value}")
+    return int_value
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Runs the post-fetch phase of the pipeline")
 
@@ -49,6 +60,21 @@ if __name__ == "__main__":
                         help="Path to a CSV file to write raw message and demographic responses to, for use in "
                              "radio show production"),
 
+    parser.add_argument("--ws-correction-processes", type=positive_int, default=1,
+                        help="Number of worker processes to use to move WS messages. Defaults to 1, which moves the "
+                             "messages in the main process")
+    parser.add_argument("--cleaner-processes", type=positive_int, default=1,
+                        help="Number of worker processes to run the auto-coding cleaners in. Defaults to 1, which runs "
+                             "the cleaners in the main process")
+    parser.add_argument("--coda-export-threads", type=positive_int,
+                        help="Number of threads to write the Coda files with. Defaults to one thread per Coda file")
+    parser.add_argument("--incremental-coda-export", action="store_true",
+                        help="Only write messages which are not in the Coda files in prev-coded-dir-path to the "
+                             "Coda files in coded-dir-path, rather than every message")
+    parser.add_argument("--dataset-statistics-output-path",
+                        help="Path to a JSON file to write statistics about the size of the dataset at each stage of "
+                             "the pipeline to")
+
     args = parser.parse_args()
 
     csv_by_message_drive_path = None
@@ -70,6 +96,12 @@ if __name__ == "__main__":
     csv_by_individual_output_path = args.csv_by_individual_output_path
     production_csv_output_path = args.production_csv_output_path
 
+    ws_correction_processes = args.ws_correction_processes
+    cleaner_processes = args.cleaner_processes
+    coda_export_threads = args.coda_export_threads
+    incremental_coda_export = args.incremental_coda_export
+    dataset_statistics_output_path = args.dataset_statistics_output_path
+
     # Load the pipeline configuration file
     log.info("Loading Pipeline Configuration File...")
     with open(pipeline_configuration_file_path) as f:
@@ -81,55 +113,54 @@ if __name__ == "__main__":
             google_cloud_credentials_file_path, pipeline_configuration.drive_upload.drive_credentials_file_url))
         drive_client_wrapper.init_client_from_info(credentials_info)
 
-    # Load the input datasets
-    def load_datasets(flow_names):
-        datasets = []
-        for i, flow_name in enumerate(flow_names):
-            raw_flow_path = f"{raw_data_dir}/{flow_name}.jsonl"
-            log.info(f"Loading {i + 1}/{len(flow_names)}: {raw_flow_path}...")
-            with open(raw_flow_path, "r") as f:
-                runs = TracedDataJsonIO.import_jsonl_to_traced_data_iterable(f)
-            log.info(f"Loaded {len(runs)} runs")
-            datasets.append(runs)
-        return datasets
-
-    activation_flow_names = []
-    survey_flow_names = []
-    for raw_data_source in pipeline_configuration.raw_data_sources:
-        activation_flow_names.extend(raw_data_source.get_activation_flow_names())
-        survey_flow_names.extend(raw_data_source.get_survey_flow_names())
-
-    log.info("Loading activation datasets...")
-    activation_datasets = load_datasets(activation_flow_names)
-
-    log.info("Loading survey datasets...")
-    survey_datasets = load_datasets(survey_flow_names)
-
-    # Add survey data to the messages
-    log.info("Combining Datasets...")
-    coalesced_survey_datasets = []
-    for dataset in survey_datasets:
-        coalesced_survey_datasets.append(CombineRawDatasets.coalesce_traced_runs_by_key(user, dataset, "avf_phone_id"))
-    data = CombineRawDatasets.combine_raw_datasets(user, activation_datasets, coalesced_survey_datasets)
-
-    log.info("Translating Rapid Pro Keys...")
-    data = TranslateRapidProKeys.translate_rapid_pro_keys(user, data, pipeline_configuration)
+    # Load the input datasets, and add the survey data to the messages
+    data = LoadRawData.load_messages(user, raw_data_dir, pipeline_configuration)
+
+    dataset_statistics = DatasetStatistics()
+    dataset_statistics.collect("TranslateRapidProKeys", data)
+
+    # Each of the previous Coda files is parsed at most once, and shared between WS correction and the manual label
+    # import.
+    prev_coda_datasets = CodaDatasets(prev_coded_dir_path)
+
+    # Message ids are shared between WS correction and the Coda export, so that each distinct message text is only
+    # hashed once.
+    message_id_cache = MessageIdCache()
 
     if pipeline_configuration.move_ws_messages:
         log.info("Moving WS messages...")
-        data = WSCorrection.move_wrong_scheme_messages(user, data, prev_coded_dir_path)
+        data = WSCorrection.move_wrong_scheme_messages(user, data, prev_coda_datasets, message_id_cache,
+                                                       processes=ws_correction_processes)
+        dataset_statistics.collect("WSCorrection", data)
+        # (ru_maxrss is reported in kilobytes on Linux. For RUSAGE_CHILDREN, it is the peak of the largest worker
+        #  process which has exited, so is 0 if WS correction ran in this process)
+        log.info(f"Peak memory usage after moving WS messages: "
+                 f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB in this process, "
+                 f"{resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024:.1f} MB in the largest worker "
+                 f"process")
     else:
         log.info("Not moving WS messages (because the 'MoveWSMessages' key in the pipeline configuration "
                  "json was set to 'false')")
 
     log.info("Auto Coding...")
-    data = AutoCode.auto_code(user, data, pipeline_configuration, icr_output_dir, coded_dir_path)
+    data, message_index = AutoCode.auto_code(
+        user, data, pipeline_configuration, icr_output_dir, coded_dir_path, message_id_cache, cleaner_processes,
+        prev_coda_datasets if incremental_coda_export else None, coda_export_threads
+    )
+    dataset_statistics.collect("AutoCode", data, message_index)
 
     log.info("Exporting production CSV...")
     data = ProductionFile.generate(data, production_csv_output_path)
 
     log.info("Applying Manual Codes from Coda...")
-    data = ApplyManualCodes.apply_manual_codes(user, data, prev_coded_dir_path)
+    data = ApplyManualCodes.apply_manual_codes(user, data, prev_coda_datasets, message_index)
+    dataset_statistics.collect("ApplyManualCodes", data, message_index)
+
+    if dataset_statistics_output_path is not None:
+        log.info("Writing dataset statistics to file...")
+        IOUtils.ensure_dirs_exist_for_file(dataset_statistics_output_path)
+        with open(dataset_statistics_output_path, "w") as f:
+            dataset_statistics.export_to_json(f)
 
     log.info("Generating Analysis CSVs...")
     messages_data, individuals_data = AnalysisFile.generate(user, data, csv_by_message_output_path,
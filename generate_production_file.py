@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+
+from core_data_modules.logging import Logger
+from core_data_modules.util import IOUtils
+from storage.google_cloud import google_cloud_utils
+from storage.google_drive import drive_client_wrapper
+
+from src import LoadRawData, AutoCode, ProductionFile
+from src.lib import PipelineConfiguration
+
+Logger.set_project_name("WorldBank-PLR")
+log = Logger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates the production CSV straight from the raw data, without "
+                                                 "running the rest of the post-fetch phase of the pipeline")
+
+    parser.add_argument("user", help="User launching this program")
+    parser.add_argument("google_cloud_credentials_file_path", metavar="google-cloud-credentials-file-path",
+                        help="Path to a Google Cloud service account credentials file to use to access the "
+                             "credentials bucket")
+    parser.add_argument("pipeline_configuration_file_path", metavar="pipeline-configuration-file",
+                        help="Path to the pipeline configuration json file")
+
+    parser.add_argument("raw_data_dir", metavar="raw-data-dir",
+                        help="Path to a directory containing the raw data files exported by fetch_raw_data.py")
+    parser.add_argument("production_csv_output_path", metavar="production-csv-output-path",
+                        help="Path to a CSV file to write raw message and demographic responses to, for use in "
+                             "radio show production")
+
+    args = parser.parse_args()
+
+    user = args.user
+    google_cloud_credentials_file_path = args.google_cloud_credentials_file_path
+    pipeline_configuration_file_path = args.pipeline_configuration_file_path
+
+    raw_data_dir = args.raw_data_dir
+    production_csv_output_path = args.production_csv_output_path
+
+    # Load the pipeline configuration file
+    log.info("Loading Pipeline Configuration File...")
+    with open(pipeline_configuration_file_path) as f:
+        pipeline_configuration = PipelineConfiguration.from_configuration_file(f)
+
+    if pipeline_configuration.drive_upload is not None:
+        log.info(f"Downloading Google Drive service account credentials...")
+        credentials_info = json.loads(google_cloud_utils.download_blob_to_string(
+            google_cloud_credentials_file_path, pipeline_configuration.drive_upload.drive_credentials_file_url))
+        drive_client_wrapper.init_client_from_info(credentials_info)
+
+    # Load the input datasets, and add the survey data to the messages
+    data = LoadRawData.load_messages(user, raw_data_dir, pipeline_configuration)
+
+    # Apply the same message filters as the auto-coding stage of generate_outputs.py, so that this CSV contains the
+    # same messages as the production CSV exported by the full pipeline.
+    # Note that WS correction is not run here, so messages which were sent in response to the wrong question are not
+    # moved to the right column until the full pipeline is next run.
+    log.info("Filtering messages...")
+    data = AutoCode.filter_messages(data, pipeline_configuration.project_start_date,
+                                    pipeline_configuration.project_end_date,
+                                    pipeline_configuration.filter_test_messages)
+
+    log.info("Exporting production CSV...")
+    IOUtils.ensure_dirs_exist_for_file(production_csv_output_path)
+    ProductionFile.generate(data, production_csv_output_path)
+
+    if pipeline_configuration.drive_upload is not None:
+        log.info("Uploading production CSV to Google Drive...")
+        production_csv_drive_dir = os.path.dirname(pipeline_configuration.drive_upload.production_upload_path)
+        production_csv_drive_file_name = os.path.basename(pipeline_configuration.drive_upload.production_upload_path)
+        drive_client_wrapper.update_or_create(production_csv_output_path, production_csv_drive_dir,
+                                              target_file_name=production_csv_drive_file_name,
+                                              target_folder_is_shared_with_me=True)
+    else:
+        log.info("Skipping uploading to Google Drive (because the pipeline configuration json does not contain the key "
+                 "'DriveUploadPaths')")
+
+    log.info("Python script complete")
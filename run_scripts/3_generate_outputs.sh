@@ -13,6 +13,9 @@ while [[ $# -gt 0 ]]; do
             MEMORY_PROFILE_OUTPUT_PATH="$2"
             MEMORY_PROFILE_ARG="--profile-memory $MEMORY_PROFILE_OUTPUT_PATH"
             shift 2;;
+        --incremental-coda-export)
+            INCREMENTAL_CODA_EXPORT_ARG="--incremental-coda-export"
+            shift 1;;
         --)
             shift
             break;;
@@ -22,7 +25,7 @@ while [[ $# -gt 0 ]]; do
 done
 
 if [[ $# -ne 4 ]]; then
-    echo "Usage: ./3_generate_outputs.sh [--profile-cpu <cpu-profile-output-path>] [--profile-memory <memory-profile-output-path>] <user> <google-cloud-credentials-file-path> <pipeline-configuration-file-path> <data-root>"
+    echo "Usage: ./3_generate_outputs.sh [--profile-cpu <cpu-profile-output-path>] [--profile-memory <memory-profile-output-path>] [--incremental-coda-export] <user> <google-cloud-credentials-file-path> <pipeline-configuration-file-path> <data-root>"
     echo "Generates the outputs needed downstream from raw data files generated by step 2 and uploads to Google Drive"
     exit
 fi
@@ -36,7 +39,8 @@ mkdir -p "$DATA_ROOT/Coded Coda Files"
 mkdir -p "$DATA_ROOT/Outputs"
 
 cd ..
-./docker-run-generate-outputs.sh ${CPU_PROFILE_ARG} ${MEMORY_PROFILE_ARG} \
+./docker-run-generate-outputs.sh ${CPU_PROFILE_ARG} ${MEMORY_PROFILE_ARG} ${INCREMENTAL_CODA_EXPORT_ARG} \
+    --dataset-statistics-output-path "$DATA_ROOT/Outputs/dataset_statistics.json" \
     "$USER" "$GOOGLE_CLOUD_CREDENTIALS_FILE_PATH" "$PIPELINE_CONFIGURATION_FILE_PATH" \
     "$DATA_ROOT/Raw Data" "$DATA_ROOT/Coded Coda Files/" \
     "$DATA_ROOT/Outputs/messages_traced_data.jsonl" "$DATA_ROOT/Outputs/individuals_traced_data.jsonl" \
@@ -2,8 +2,21 @@
 
 set -e
 
+while [[ $# -gt 0 ]]; do
+    case "$1" in
+        --early-production-file)
+            EARLY_PRODUCTION_FILE=true
+            shift 1;;
+        --)
+            shift
+            break;;
+        *)
+            break;;
+    esac
+done
+
 if [[ $# -ne 9 ]]; then
-    echo "Usage: ./run_pipeline.sh"
+    echo "Usage: ./run_pipeline.sh [--early-production-file]"
     echo "  <user> <pipeline-configuration-json>"
     echo "  <coda-pull-credentials-path> <coda-push-credentials-path> <avf-bucket-credentials-path>"
     echo "  <coda-tools-root> <data-root> <data-backup-dir> <performance-logs-dir>"
@@ -29,6 +42,10 @@ RUN_ID="$DATE-$HASH"
 
 ./2_fetch_raw_data.sh "$USER" "$AVF_BUCKET_CREDENTIALS_PATH" "$PIPELINE_CONFIGURATION" "$DATA_ROOT"
 
+if [[ "$EARLY_PRODUCTION_FILE" = true ]]; then
+    ./2a_generate_production_file.sh "$USER" "$AVF_BUCKET_CREDENTIALS_PATH" "$PIPELINE_CONFIGURATION" "$DATA_ROOT"
+fi
+
 ./3_generate_outputs.sh --profile-memory "$PERFORMANCE_LOGS_DIR/memory-$RUN_ID.profile" \
     "$USER" "$AVF_BUCKET_CREDENTIALS_PATH" "$PIPELINE_CONFIGURATION" "$DATA_ROOT"
 
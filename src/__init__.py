@@ -2,6 +2,7 @@ from .analysis_file import AnalysisFile
 from .apply_manual_codes import ApplyManualCodes
 from .auto_code import AutoCode
 from .combine_raw_datasets import CombineRawDatasets
+from .load_raw_data import LoadRawData
 from .production_file import ProductionFile
 from .translate_rapid_pro_keys import TranslateRapidProKeys
 from .ws_correction import WSCorrection
@@ -1,13 +1,11 @@
 import time
-from os import path
+from collections import ChainMap
 
 from core_data_modules.cleaners import Codes
-from core_data_modules.cleaners.cleaning_utils import CleaningUtils
 from core_data_modules.logging import Logger
 from core_data_modules.traced_data import Metadata
-from core_data_modules.traced_data.io import TracedDataCodaV2IO
 
-from src.lib import PipelineConfiguration
+from src.lib import PipelineConfiguration, ControlCodeLabels
 from src.lib.code_schemes import CodeSchemes
 from src.lib.pipeline_configuration import CodingModes
 
@@ -16,139 +14,136 @@ log = Logger(__name__)
 
 class ApplyManualCodes(object):
     @staticmethod
-    def _impute_coding_error_codes(user, data):
-        for td in data:
-            coding_error_dict = dict()
-            for plan in PipelineConfiguration.RQA_CODING_PLANS + PipelineConfiguration.SURVEY_CODING_PLANS:
-                rqa_codes = []
+    def _get_missing_codes(td, control_code_labels):
+        # Label data for which there is no response as TRUE_MISSING.
+        # Label data for which the response is the empty string as NOT_CODED.
+        missing_dict = dict()
+        for plan in PipelineConfiguration.PLAN_REGISTRY.all_plans:
+            if plan.raw_field not in td:
                 for cc in plan.coding_configurations:
-                    if cc.coding_mode == CodingModes.SINGLE:
-                        if cc.coded_field in td:
-                            label = td[cc.coded_field]
-                            rqa_codes.append(cc.code_scheme.get_code_with_code_id(label["CodeID"]))
-                    else:
-                        assert cc.coding_mode == CodingModes.MULTIPLE
-                        for label in td.get(cc.coded_field, []):
-                            rqa_codes.append(cc.code_scheme.get_code_with_code_id(label["CodeID"]))
-
-                has_ws_code_in_code_scheme = False
-                for code in rqa_codes:
-                    if code.control_code == Codes.WRONG_SCHEME:
-                        has_ws_code_in_code_scheme = True
-
-                has_ws_code_in_ws_scheme = False
-                if f"{plan.raw_field}_correct_dataset" in td:
-                    ws_code = CodeSchemes.WS_CORRECT_DATASET.get_code_with_code_id(
-                        td[f"{plan.raw_field}_correct_dataset"]["CodeID"])
-                    has_ws_code_in_ws_scheme = ws_code.code_type == "Normal" or ws_code.control_code == Codes.NOT_CODED
-
-                if has_ws_code_in_code_scheme != has_ws_code_in_ws_scheme:
-                    log.warning(f"Coding Error: {plan.raw_field}: {td[plan.raw_field]}")
-                    coding_error_dict[f"{plan.raw_field}_correct_dataset"] = \
-                        CleaningUtils.make_label_from_cleaner_code(
-                            CodeSchemes.WS_CORRECT_DATASET,
-                            CodeSchemes.WS_CORRECT_DATASET.get_code_with_control_code(Codes.CODING_ERROR),
-                            Metadata.get_call_location(),
-                        ).to_dict()
-
-                    for cc in plan.coding_configurations:
-                        if cc.coding_mode == CodingModes.SINGLE:
-                            coding_error_dict[cc.coded_field] = \
-                                CleaningUtils.make_label_from_cleaner_code(
-                                    cc.code_scheme,
-                                    cc.code_scheme.get_code_with_control_code(Codes.CODING_ERROR),
-                                    Metadata.get_call_location()
-                                ).to_dict()
-                        else:
-                            assert cc.coding_mode == CodingModes.MULTIPLE
-                            coding_error_dict[cc.coded_field] = [
-                                CleaningUtils.make_label_from_cleaner_code(
-                                    cc.code_scheme,
-                                    cc.code_scheme.get_code_with_control_code(Codes.CODING_ERROR),
-                                    Metadata.get_call_location()
-                                ).to_dict()
-                            ]
-
-            td.append_data(coding_error_dict, Metadata(user, Metadata.get_call_location(), time.time()))
+                    na_label = control_code_labels.get_label(cc.code_scheme, Codes.TRUE_MISSING)
+                    missing_dict[cc.coded_field] = na_label if cc.coding_mode == CodingModes.SINGLE else [na_label]
+            elif td[plan.raw_field] == "":
+                for cc in plan.coding_configurations:
+                    nc_label = control_code_labels.get_label(cc.code_scheme, Codes.NOT_CODED)
+                    missing_dict[cc.coded_field] = nc_label if cc.coding_mode == CodingModes.SINGLE else [nc_label]
+        return missing_dict
 
-    @classmethod
-    def apply_manual_codes(cls, user, data, coda_input_dir):
-        # Merge manually coded data into the cleaned dataset
-        for plan in PipelineConfiguration.RQA_CODING_PLANS + PipelineConfiguration.SURVEY_CODING_PLANS:
-            if plan.coda_filename is None:
-                continue
+    @staticmethod
+    def _get_noise_codes(td, control_code_labels):
+        # Mark data that is noise as Codes.NOT_CODED
+        nc_dict = dict()
+        if td.get("noise", False):
+            for plan in PipelineConfiguration.PLAN_REGISTRY.rqa_plans:
+                for cc in plan.coding_configurations:
+                    if cc.coded_field not in td:
+                        nc_label = control_code_labels.get_label(cc.code_scheme, Codes.NOT_CODED)
+                        nc_dict[cc.coded_field] = nc_label if cc.coding_mode == CodingModes.SINGLE else [nc_label]
+        return nc_dict
 
-            coda_input_path = path.join(coda_input_dir, plan.coda_filename)
+    @staticmethod
+    def _get_imputed_codes(td, control_code_labels):
+        # Run code imputation functions
+        imputed_dict = dict()
+        for plan in PipelineConfiguration.PLAN_REGISTRY.all_plans:
+            if plan.code_imputation_function is not None:
+                imputed_dict.update(
+                    plan.code_imputation_function(td, plan.coding_configurations, control_code_labels))
+        return imputed_dict
 
+    @staticmethod
+    def _get_coding_error_codes(td, control_code_labels):
+        coding_error_dict = dict()
+        for plan in PipelineConfiguration.PLAN_REGISTRY.all_plans:
+            rqa_codes = []
             for cc in plan.coding_configurations:
-                f = None
-                try:
-                    if path.exists(coda_input_path):
-                        f = open(coda_input_path, "r")
+                if cc.coding_mode == CodingModes.SINGLE:
+                    if cc.coded_field in td:
+                        label = td[cc.coded_field]
+                        rqa_codes.append(cc.code_scheme.get_code_with_code_id(label["CodeID"]))
+                else:
+                    assert cc.coding_mode == CodingModes.MULTIPLE
+                    for label in td.get(cc.coded_field, []):
+                        rqa_codes.append(cc.code_scheme.get_code_with_code_id(label["CodeID"]))
+
+            has_ws_code_in_code_scheme = False
+            for code in rqa_codes:
+                if code.control_code == Codes.WRONG_SCHEME:
+                    has_ws_code_in_code_scheme = True
+
+            has_ws_code_in_ws_scheme = False
+            if f"{plan.raw_field}_correct_dataset" in td:
+                ws_code = CodeSchemes.WS_CORRECT_DATASET.get_code_with_code_id(
+                    td[f"{plan.raw_field}_correct_dataset"]["CodeID"])
+                has_ws_code_in_ws_scheme = ws_code.code_type == "Normal" or ws_code.control_code == Codes.NOT_CODED
+
+            if has_ws_code_in_code_scheme != has_ws_code_in_ws_scheme:
+                log.warning(f"Coding Error: {plan.raw_field}: {td[plan.raw_field]}")
+                coding_error_dict[f"{plan.raw_field}_correct_dataset"] = \
+                    control_code_labels.get_label(CodeSchemes.WS_CORRECT_DATASET, Codes.CODING_ERROR)
 
+                for cc in plan.coding_configurations:
+                    ce_label = control_code_labels.get_label(cc.code_scheme, Codes.CODING_ERROR)
                     if cc.coding_mode == CodingModes.SINGLE:
-                        TracedDataCodaV2IO.import_coda_2_to_traced_data_iterable(
-                            user, data, plan.id_field, {cc.coded_field: cc.code_scheme}, f)
+                        coding_error_dict[cc.coded_field] = ce_label
                     else:
-                        TracedDataCodaV2IO.import_coda_2_to_traced_data_iterable_multi_coded(
-                            user, data, plan.id_field, {cc.coded_field: cc.code_scheme}, f)
-                finally:
-                    if f is not None:
-                        f.close()
-
-            f = None
-            try:
-                if path.exists(coda_input_path):
-                    f = open(coda_input_path, "r")
-
-                TracedDataCodaV2IO.import_coda_2_to_traced_data_iterable(
-                    user, data, plan.id_field,
-                    {f"{plan.raw_field}_correct_dataset": CodeSchemes.WS_CORRECT_DATASET}, f
-                )
-            finally:
-                if f is not None:
-                    f.close()
+                        assert cc.coding_mode == CodingModes.MULTIPLE
+                        coding_error_dict[cc.coded_field] = [ce_label]
+        return coding_error_dict
 
-        # Label data for which there is no response as TRUE_MISSING.
-        # Label data for which the response is the empty string as NOT_CODED.
-        for td in data:
-            missing_dict = dict()
-            for plan in PipelineConfiguration.RQA_CODING_PLANS + PipelineConfiguration.SURVEY_CODING_PLANS:
-                if plan.raw_field not in td:
-                    for cc in plan.coding_configurations:
-                        na_label = CleaningUtils.make_label_from_cleaner_code(
-                            cc.code_scheme, cc.code_scheme.get_code_with_control_code(Codes.TRUE_MISSING),
-                            Metadata.get_call_location()
-                        ).to_dict()
-                        missing_dict[cc.coded_field] = na_label if cc.coding_mode == CodingModes.SINGLE else [na_label]
-                elif td[plan.raw_field] == "":
-                    for cc in plan.coding_configurations:
-                        nc_label = CleaningUtils.make_label_from_cleaner_code(
-                            cc.code_scheme, cc.code_scheme.get_code_with_control_code(Codes.NOT_CODED),
-                            Metadata.get_call_location()
-                        ).to_dict()
-                        missing_dict[cc.coded_field] = nc_label if cc.coding_mode == CodingModes.SINGLE else [nc_label]
-            td.append_data(missing_dict, Metadata(user, Metadata.get_call_location(), time.time()))
+    @classmethod
+    def apply_manual_codes(cls, user, data, coda_datasets, message_index=None):
+        """
+        Imports the manually assigned labels from Coda, then labels missing, noise, imputed, and inconsistently coded
+        data.
+
+        :param user: Identifier of the user running this program, for TracedData Metadata.
+        :type user: str
+        :param data: TracedData objects to apply the codes to.
+        :type data: list of TracedData
+        :param coda_datasets: Coda files to import the manual labels from.
+        :type coda_datasets: src.lib.CodaDatasets
+        :param message_index: Index of the raw fields of the coding plans in `data`. If provided, the labels for each
+                              Coda file are only imported into the messages which contain that plan's raw field,
+                              rather than every message being searched for that plan's message id.
+                              The index must have been built from `data` after its raw fields were last added to or
+                              hidden, as in AutoCode.auto_code. This stage does not add or hide raw fields, so the
+                              index is still valid after it.
+        :type message_index: src.lib.MessageIndex | None
+        :return: `data`, with the codes applied.
+        :rtype: list of TracedData
+        """
+        if message_index is not None:
+            message_index.assert_indexes(data)
+
+        # The TRUE_MISSING, NOT_CODED and CODING_ERROR labels assigned by this stage are the same for every message,
+        # so build each of them once.
+        control_code_labels = ControlCodeLabels(Metadata.get_call_location())
 
-        # Mark data that is noise as Codes.NOT_CODED
+        # Merge manually coded data into the cleaned dataset
+        for plan in PipelineConfiguration.PLAN_REGISTRY.coda_plans:
+            # Only messages which contain the plan's raw field have a message id for it.
+            # Plans which have not been uploaded to Coda yet have no Coda file, so all their messages are NOT_REVIEWED.
+            plan_messages = data if message_index is None else message_index.get_messages(plan.raw_field)
+            coda_datasets.import_plan_labels_to_traced_data_iterable(
+                user, plan_messages, plan.coda_filename, missing_ok=True)
+
+        # Apply the missing, noise, code imputation, and coding error passes to each message in turn. Each pass
+        # reads a view of the message with the codes from the passes before it applied, so that all the passes can be
+        # applied to the message in a single append, which is skipped if none of the codes changed.
+        passes = [cls._get_missing_codes, cls._get_noise_codes, cls._get_imputed_codes, cls._get_coding_error_codes]
+        appends_count = 0
         for td in data:
-            if td.get("noise", False):
-                nc_dict = dict()
-                for plan in PipelineConfiguration.RQA_CODING_PLANS:
-                    for cc in plan.coding_configurations:
-                        if cc.coded_field not in td:
-                            nc_label = CleaningUtils.make_label_from_cleaner_code(
-                                cc.code_scheme, cc.code_scheme.get_code_with_control_code(Codes.NOT_CODED),
-                                Metadata.get_call_location()
-                            ).to_dict()
-                            nc_dict[cc.coded_field] = nc_label if cc.coding_mode == CodingModes.SINGLE else [nc_label]
-                td.append_data(nc_dict, Metadata(user, Metadata.get_call_location(), time.time()))
-
-        # Run code imputation functions
-        for plan in PipelineConfiguration.RQA_CODING_PLANS + PipelineConfiguration.SURVEY_CODING_PLANS:
-            if plan.code_imputation_function is not None:
-                plan.code_imputation_function(user, data, plan.coding_configurations)
-
-        cls._impute_coding_error_codes(user, data)
+            updated_codes = dict()
+            view = ChainMap(updated_codes, td)
+            for get_codes in passes:
+                updated_codes.update(get_codes(view, control_code_labels))
+
+            changed_codes = {key: value for key, value in updated_codes.items() if key not in td or td[key] != value}
+            if len(changed_codes) > 0:
+                td.append_data(changed_codes, Metadata(user, Metadata.get_call_location(), time.time()))
+                appends_count += 1
+        log.info(f"Applied the missing, noise, imputed and coding error codes to {len(data)} messages in "
+                 f"{appends_count} appends ({len(data) - appends_count} messages were unchanged)")
 
         return data
@@ -1,113 +1,238 @@
+import multiprocessing
 import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from os import path
 
+from core_data_modules.cleaners import Codes
 from core_data_modules.cleaners.cleaning_utils import CleaningUtils
 from core_data_modules.logging import Logger
+from core_data_modules.traced_data import Metadata
 from core_data_modules.traced_data.io import TracedDataCSVIO, TracedDataCodaV2IO
 from core_data_modules.util import IOUtils
 
-from src.lib import PipelineConfiguration, MessageFilters, ICRTools
+from src.lib import PipelineConfiguration, MessageFilters, MemoisedCleaners, ICRTools, MessageIndex
 
 log = Logger(__name__)
 
 
+def _clean_texts(task):
+    # Cleaners are looked up by coded field rather than sent to the worker processes, because some of them are
+    # lambdas, which can't be pickled.
+    coded_field, texts = task
+    plan, cc = PipelineConfiguration.PLAN_REGISTRY.get_coding_configuration_by_coded_field(coded_field)
+    return [cc.cleaner(text) for text in texts]
+
+
 class AutoCode(object):
     NOISE_KEY = "noise"
     ICR_MESSAGES_COUNT = 200
     ICR_SEED = 0
 
-    @staticmethod
-    def log_empty_string_stats_for_field(data, raw_fields):
-        for raw_field in raw_fields:
-            total_messages_count = 0
-            empty_string_messages_count = 0
-
-            for td in data:
-                if raw_field in td:
-                    total_messages_count += 1
-                    if td[raw_field] == "":
-                        empty_string_messages_count += 1
-
-            log.debug(f"{raw_field}: {empty_string_messages_count} messages were \"\", out "
-                      f"of {total_messages_count} total")
-
-    @classmethod
-    def log_empty_string_stats(cls, data):
-        # Compute the number of RQA messages that were the empty string
-        log.debug("Counting the number of empty string messages for each raw radio show field...")
-        raw_rqa_fields = []
-        for plan in PipelineConfiguration.RQA_CODING_PLANS:
-            if plan.raw_field not in raw_rqa_fields:
-                raw_rqa_fields.append(plan.raw_field)
-        cls.log_empty_string_stats_for_field(data, raw_rqa_fields)
-
-        # Compute the number of survey messages that were the empty string
-        log.debug("Counting the number of empty string messages for each survey field...")
-        raw_survey_fields = []
-        for plan in PipelineConfiguration.SURVEY_CODING_PLANS:
-            if plan.raw_field not in raw_survey_fields:
-                raw_survey_fields.append(plan.raw_field)
-        survey_data = dict()
-        for td in data:
-            survey_data[td["uid"]] = td
-        cls.log_empty_string_stats_for_field(survey_data.values(), raw_survey_fields)
-
     @classmethod
     def filter_messages(cls, data, project_start_date, project_end_date, filter_test_messages=True):
+        # Chain the filters as generators, so that the data is filtered in a single pass without materialising the
+        # intermediate lists.
+        drop_counts = Counter()
+        filtered = data
+
         # Filter out test messages sent by AVF.
         if filter_test_messages:
-            data = MessageFilters.filter_test_messages(data)
+            filtered = MessageFilters.iter_non_test_messages(filtered, drop_counts)
         else:
             log.debug("Not filtering out test messages (because the pipeline configuration json key "
                       "'FilterTestMessages' was set to false)")
 
         # Filter for runs which don't contain a response to any week's question
-        data = MessageFilters.filter_empty_messages(data,
-                                                    [plan.raw_field for plan in PipelineConfiguration.RQA_CODING_PLANS])
+        filtered = MessageFilters.iter_non_empty_messages(
+            filtered, drop_counts, PipelineConfiguration.PLAN_REGISTRY.rqa_raw_fields)
 
         # Filter out runs sent outwith the project start and end dates
-        time_keys = {plan.time_field for plan in PipelineConfiguration.RQA_CODING_PLANS}
-        data = MessageFilters.filter_time_range(data, time_keys, project_start_date, project_end_date)
+        time_keys = set(PipelineConfiguration.PLAN_REGISTRY.rqa_time_fields)
+        filtered = MessageFilters.iter_messages_in_time_range(
+            filtered, drop_counts, time_keys, project_start_date, project_end_date)
 
-        return data
+        filtered = list(filtered)
+        log.info(f"Filtered messages. Returning {len(filtered)}/{len(data)} messages "
+                 f"(dropped {drop_counts['test']} test messages, {drop_counts['empty']} empty messages, and "
+                 f"{drop_counts['time_range']} messages sent outside the time range "
+                 f"{project_start_date.isoformat()} to {project_end_date.isoformat()})")
 
-    @classmethod
-    def run_cleaners(cls, user, data):
-        for plan in PipelineConfiguration.RQA_CODING_PLANS + PipelineConfiguration.SURVEY_CODING_PLANS:
+        return filtered
+
+    @staticmethod
+    def _clean_distinct_texts_in_parallel(data, processes, texts_per_task=1000):
+        """
+        Cleans the distinct raw values of each plan with each of that plan's cleaners in a pool of worker processes.
+
+        :return: Dictionary of coded field -> (dictionary of raw text -> clean value), for every coding configuration
+                 with a cleaner and every raw value of its plan in `data`.
+        :rtype: dict of str -> (dict of str -> str)
+        """
+        tasks = []  # of (coded field, list of texts)
+        for plan in PipelineConfiguration.PLAN_REGISTRY.all_plans:
+            if all(cc.cleaner is None for cc in plan.coding_configurations):
+                continue
+
+            texts = list({td[plan.raw_field] for td in data if plan.raw_field in td})
             for cc in plan.coding_configurations:
-                if cc.cleaner is not None:
-                    CleaningUtils.apply_cleaner_to_traced_data_iterable(user, data, plan.raw_field, cc.coded_field,
-                                                                        cc.cleaner, cc.code_scheme)
+                if cc.cleaner is None:
+                    continue
+                for i in range(0, len(texts), texts_per_task):
+                    tasks.append((cc.coded_field, texts[i:i + texts_per_task]))
 
-    @classmethod
-    def export_coda(cls, user, data, coda_output_dir):
-        IOUtils.ensure_dirs_exist(coda_output_dir)
-        for plan in PipelineConfiguration.RQA_CODING_PLANS + PipelineConfiguration.SURVEY_CODING_PLANS:
-            if plan.coda_filename is None:
+        log.info(f"Cleaning distinct raw values in {len(tasks)} tasks, using {processes} processes...")
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_clean_texts, tasks)
+
+        clean_values = dict()  # of coded field -> (dict of text -> clean value)
+        for (coded_field, texts), task_clean_values in zip(tasks, results):
+            clean_values.setdefault(coded_field, dict()).update(zip(texts, task_clean_values))
+        return clean_values
+
+    @staticmethod
+    def _apply_clean_values_to_traced_data_iterable(user, data, raw_key, clean_key, cleaner, get_clean_value, scheme):
+        """
+        Labels each TracedData with the clean value of its raw text, in the same way as
+        CleaningUtils.apply_cleaner_to_traced_data_iterable, but getting the clean values from `get_clean_value`
+        rather than by running `cleaner` on each text.
+
+        :param user: Identifier of the user running this program, for TracedData Metadata.
+        :type user: str
+        :param data: TracedData objects to apply the cleaner to.
+        :type data: iterable of TracedData
+        :param raw_key: Key in each TracedData of the raw text to clean.
+        :type raw_key: str
+        :param clean_key: Key in each TracedData to write the label to.
+        :type clean_key: str
+        :param cleaner: Cleaner which the clean values are the results of. This is the origin of the labels.
+        :type cleaner: function of str -> str
+        :param get_clean_value: Function which returns the result of running `cleaner` on a raw text.
+        :type get_clean_value: function of str -> str
+        :param scheme: Code scheme to label the clean values with.
+        :type scheme: core_data_modules.data_models.CodeScheme
+        """
+        origin_id = Metadata.get_function_location(cleaner)
+        for td in data:
+            if raw_key not in td:
                 continue
 
-            TracedDataCodaV2IO.compute_message_ids(user, data, plan.raw_field, plan.id_field)
+            # Don't label data which the cleaner couldn't code
+            clean_value = get_clean_value(td[raw_key])
+            if clean_value == Codes.NOT_CODED:
+                continue
+
+            label = CleaningUtils.make_label_from_cleaner_code(
+                scheme, scheme.get_code_with_match_value(clean_value), origin_id)
+            td.append_data({clean_key: label.to_dict()}, Metadata(user, Metadata.get_call_location(), time.time()))
+
+    @classmethod
+    def run_cleaners(cls, user, data, processes=1):
+        """
+        Runs each coding configuration's cleaner on the raw field of its coding plan.
+
+        :param user: Identifier of the user running this program, for TracedData Metadata.
+        :type user: str
+        :param data: TracedData objects to clean.
+        :type data: list of TracedData
+        :param processes: Number of worker processes to run the cleaners in. If 1, runs the cleaners in this process.
+                          Otherwise, the distinct raw values of each plan are cleaned in a process pool first, and the
+                          resulting labels are then applied to the TracedData in this process.
+        :type processes: int
+        """
+        assert processes >= 1, f"processes must be at least 1, but was {processes}"
+
+        clean_values = None
+        if processes > 1:
+            clean_values = cls._clean_distinct_texts_in_parallel(data, processes)
+
+        # Demographic answers are highly repetitive, so when running in this process, run the cleaners through a cache
+        # of previously cleaned texts. When the cleaners were run in a process pool, apply their results directly.
+        for plan in PipelineConfiguration.PLAN_REGISTRY.all_plans:
+            for cc in plan.coding_configurations:
+                if cc.cleaner is None:
+                    continue
 
-            coda_output_path = path.join(coda_output_dir, plan.coda_filename)
-            with open(coda_output_path, "w") as f:
-                TracedDataCodaV2IO.export_traced_data_iterable_to_coda_2(
-                    data, plan.raw_field, plan.time_field, plan.id_field,
-                    {cc.coded_field: cc.code_scheme for cc in plan.coding_configurations},
-                    f
+                if clean_values is None:
+                    get_clean_value = MemoisedCleaners.get(cc.cleaner, name=cc.coded_field)
+                else:
+                    # Every raw text of this plan in `data` was cleaned in the process pool.
+                    get_clean_value = clean_values.get(cc.coded_field, dict()).__getitem__
+                cls._apply_clean_values_to_traced_data_iterable(
+                    user, data, plan.raw_field, cc.coded_field, cc.cleaner, get_clean_value, cc.code_scheme
                 )
 
+        if clean_values is None:
+            MemoisedCleaners.log_hit_rates()
+
+    @staticmethod
+    def _export_coda_file(message_index, plan, coda_output_dir, prev_coda_datasets):
+        plan_messages = message_index.get_messages(plan.raw_field)
+        data = plan_messages
+        if prev_coda_datasets is not None:
+            prev_message_ids = prev_coda_datasets.get_latest_labels_index(plan.coda_filename, missing_ok=True)
+            data = [td for td in plan_messages if td[plan.id_field] not in prev_message_ids]
+            log.info(f"Exporting {len(data)}/{len(plan_messages)} messages to {plan.coda_filename} which are not in "
+                     f"the previous Coda file")
+
+        coda_output_path = path.join(coda_output_dir, plan.coda_filename)
+        with open(coda_output_path, "w") as f:
+            TracedDataCodaV2IO.export_traced_data_iterable_to_coda_2(
+                data, plan.raw_field, plan.time_field, plan.id_field,
+                {cc.coded_field: cc.code_scheme for cc in plan.coding_configurations},
+                f
+            )
+
     @classmethod
-    def export_icr(cls, data, icr_output_dir):
-        # Output messages for ICR
-        IOUtils.ensure_dirs_exist(icr_output_dir)
-        for plan in PipelineConfiguration.RQA_CODING_PLANS:
-            rqa_messages = []
-            for td in data:
-                if plan.raw_field in td:
-                    rqa_messages.append(td)
+    def export_coda(cls, user, data, message_index, coda_output_dir, message_id_cache, prev_coda_datasets=None,
+                    threads=None):
+        """
+        Exports a Coda file for each coding plan that has a coda_filename.
 
+        :param user: Identifier of the user running this program, for TracedData Metadata.
+        :type user: str
+        :param data: TracedData objects to export.
+        :type data: list of TracedData
+        :param message_index: Index of the raw fields of the coding plans in `data`.
+        :type message_index: src.lib.MessageIndex
+        :param coda_output_dir: Directory to write the Coda files to.
+        :type coda_output_dir: str
+        :param message_id_cache: Cache of message ids to compute the Coda message ids with.
+        :type message_id_cache: src.lib.MessageIdCache
+        :param prev_coda_datasets: Coda files from a previous run of this pipeline, or None.
+                                   If None, writes every message to the Coda files.
+                                   Otherwise, writes delta Coda files, containing only the messages which are not
+                                   already in the previous Coda files.
+        :type prev_coda_datasets: src.lib.CodaDatasets | None
+        :param threads: Number of threads to write the Coda files with. If None, writes all the files in parallel.
+                        Must be at least 1.
+        :type threads: int | None
+        """
+        IOUtils.ensure_dirs_exist(coda_output_dir)
+        coda_plans = PipelineConfiguration.PLAN_REGISTRY.coda_plans
+        message_id_cache.set_message_ids(user, data, {plan.raw_field: plan.id_field for plan in coda_plans})
+        if threads is None:
+            threads = max(1, len(coda_plans))
+        assert threads >= 1, f"threads must be at least 1, but was {threads}"
+        with ThreadPoolExecutor(threads) as executor:
+            futures = [executor.submit(cls._export_coda_file, message_index, plan, coda_output_dir, prev_coda_datasets)
+                       for plan in coda_plans]
+            for future in futures:
+                # Re-raise any exception raised while exporting
+                future.result()
+
+    @classmethod
+    def export_icr(cls, message_index, icr_output_dir):
+        # Output messages for ICR.
+        # The messages for each RQA plan are looked up in the message index rather than by scanning the whole dataset,
+        # and sampled with a reservoir sampler.
+        IOUtils.ensure_dirs_exist(icr_output_dir)
+        for plan in PipelineConfiguration.PLAN_REGISTRY.rqa_plans:
             icr_messages = ICRTools.generate_sample_for_icr(
-                rqa_messages, cls.ICR_MESSAGES_COUNT, random.Random(cls.ICR_SEED))
+                message_index.get_messages(plan.raw_field),
+                cls.ICR_MESSAGES_COUNT, random.Random(cls.ICR_SEED)
+            )
 
             icr_output_path = path.join(icr_output_dir, plan.icr_filename)
             with open(icr_output_path, "w") as f:
@@ -116,13 +241,18 @@ class AutoCode(object):
                 )
 
     @classmethod
-    def auto_code(cls, user, data, pipeline_configuration, icr_output_dir, coda_output_dir):
+    def auto_code(cls, user, data, pipeline_configuration, icr_output_dir, coda_output_dir, message_id_cache,
+                  cleaner_processes=1, prev_coda_datasets=None, coda_export_threads=None):
         data = cls.filter_messages(data, pipeline_configuration.project_start_date,
                                    pipeline_configuration.project_end_date, pipeline_configuration.filter_test_messages)
 
-        cls.run_cleaners(user, data)
-        cls.export_coda(user, data, coda_output_dir)
-        cls.export_icr(data, icr_output_dir)
-        cls.log_empty_string_stats(data)
+        # Index the messages by raw field once, for the export stages below and the stages after auto-coding.
+        # None of those stages add or remove raw fields, so the index stays valid for the rest of the pipeline.
+        message_index = MessageIndex.for_coding_plans(data, PipelineConfiguration.PLAN_REGISTRY.all_plans)
+
+        cls.run_cleaners(user, data, cleaner_processes)
+        cls.export_coda(user, data, message_index, coda_output_dir, message_id_cache, prev_coda_datasets,
+                        coda_export_threads)
+        cls.export_icr(message_index, icr_output_dir)
 
-        return data
+        return data, message_index
@@ -1,5 +1,15 @@
+from .coda_datasets import CodaDatasets
 from .code_schemes import CodeSchemes
 from .consent_utils import ConsentUtils
-from .icr_tools import ICRTools
+from .control_code_labels import ControlCodeLabels
+from .dataset_statistics import DatasetStatistics
+from .fold_tools import FoldTools
+from .icr_tools import ICRTools, ReservoirSampler
+from .matrix_bitsets import MatrixBitsets
+from .memoised_cleaners import MemoisedCleaners
 from .message_filters import MessageFilters
+from .message_ids import MessageIdCache
+from .message_index import MessageIndex
 from .pipeline_configuration import PipelineConfiguration
+from .streaming_csv_writer import StreamingCSVWriter
+from .analysis_table import AnalysisTable  # Imported last because it depends on pipeline_configuration
@@ -0,0 +1,140 @@
+import itertools
+from collections import OrderedDict
+
+import numpy as np
+from core_data_modules.cleaners import Codes
+
+from src.lib.pipeline_configuration import CodingModes
+
+
+class AnalysisTable(object):
+    def __init__(self, consent_withdrawn, raw_field_present, categorical_columns, matrix_columns):
+        """
+        Columnar table of the analysis values of a set of messages or individuals, for computing statistics with
+        vectorised NumPy operations rather than Python loops over TracedData.
+
+        Construct tables with AnalysisTable.from_analysis_traced_data.
+
+        :param consent_withdrawn: Boolean column of whether each row's consent was withdrawn.
+        :type consent_withdrawn: numpy.ndarray
+        :param raw_field_present: Dictionary of raw field -> boolean column of whether each row has a non-empty value
+                                  for that field.
+        :type raw_field_present: dict of str -> numpy.ndarray
+        :param categorical_columns: Dictionary of analysis_file_key of each single-coded coding configuration ->
+                                    integer column of the position of each row's code in the code scheme, or -1 if the
+                                    row's value isn't one of the scheme's codes.
+        :type categorical_columns: dict of str -> numpy.ndarray
+        :param matrix_columns: Dictionary of analysis_file_key of each multi-coded coding configuration ->
+                               uint8 matrix of shape (rows, codes in the code scheme), which is 1 where a row has a
+                               code.
+        :type matrix_columns: dict of str -> numpy.ndarray
+        """
+        self.consent_withdrawn = consent_withdrawn
+        self.raw_field_present = raw_field_present
+        self.categorical_columns = categorical_columns
+        self.matrix_columns = matrix_columns
+
+    @classmethod
+    def from_analysis_traced_data(cls, data, coding_plans, consent_withdrawn_key="consent_withdrawn"):
+        """
+        Builds a table from TracedData produced by AnalysisFile.generate, which contain the string values of
+        single-coded analysis keys and the matrix columns of multi-coded coding configurations.
+
+        :param data: Messages or individuals TracedData to build the table from.
+        :type data: iterable of TracedData
+        :param coding_plans: Coding plans whose raw fields and analysis keys to include in the table.
+        :type coding_plans: iterable of src.lib.pipeline_configuration.CodingPlan
+        :param consent_withdrawn_key: Key in each TracedData of whether consent was withdrawn.
+        :type consent_withdrawn_key: str
+        :return: Table of the given data.
+        :rtype: AnalysisTable
+        """
+        data = list(data)
+        coding_plans = list(coding_plans)
+
+        # Read the analysis values from the TracedData in a single pass, into an object array with one column per key,
+        # then build each of the table's columns from a whole column of that array at once, rather than row by row.
+        single_coded_configurations = []
+        multi_coded_configurations = []
+        for plan in coding_plans:
+            for cc in plan.coding_configurations:
+                if cc.analysis_file_key is None:
+                    continue
+                if cc.coding_mode == CodingModes.SINGLE:
+                    single_coded_configurations.append(cc)
+                else:
+                    assert cc.coding_mode == CodingModes.MULTIPLE
+                    multi_coded_configurations.append(cc)
+
+        raw_fields = list(OrderedDict.fromkeys(plan.raw_field for plan in coding_plans))
+        keys = [consent_withdrawn_key] + raw_fields + [cc.analysis_file_key for cc in single_coded_configurations]
+        for cc in multi_coded_configurations:
+            keys.extend(f"{cc.analysis_file_key}{code.string_value}" for code in cc.code_scheme.codes)
+        # (Missing raw fields read as "", so that a raw field which is present but None still counts as present)
+        defaults = [None] + [""] * len(raw_fields) + [None] * (len(keys) - len(raw_fields) - 1)
+        key_indices = {key: i for i, key in enumerate(keys)}
+
+        values = np.array([list(map(td.get, keys, defaults)) for td in data], dtype=object) \
+            .reshape(len(data), len(keys))
+
+        consent_withdrawn = values[:, key_indices[consent_withdrawn_key]] == Codes.TRUE
+        raw_field_present = {raw_field: values[:, key_indices[raw_field]] != "" for raw_field in raw_fields}
+
+        categorical_columns = dict()
+        for cc in single_coded_configurations:
+            code_positions = dict()  # of string value -> position of the first code with that value
+            for i, code in enumerate(cc.code_scheme.codes):
+                code_positions.setdefault(code.string_value, i)
+            categorical_columns[cc.analysis_file_key] = np.fromiter(
+                map(code_positions.get, values[:, key_indices[cc.analysis_file_key]], itertools.repeat(-1)),
+                dtype=np.int32, count=len(data)
+            )
+
+        matrix_columns = dict()
+        for cc in multi_coded_configurations:
+            # (The matrix columns of rows whose consent was withdrawn are Codes.STOP, so read as 0)
+            matrix_key_indices = [key_indices[f"{cc.analysis_file_key}{code.string_value}"]
+                                  for code in cc.code_scheme.codes]
+            matrix_columns[cc.analysis_file_key] = (values[:, matrix_key_indices] == Codes.MATRIX_1).astype(np.uint8)
+
+        return cls(consent_withdrawn, raw_field_present, categorical_columns, matrix_columns)
+
+    def __len__(self):
+        return len(self.consent_withdrawn)
+
+    def consented_mask(self):
+        """
+        :return: Boolean column of whether each row's consent was not withdrawn.
+        :rtype: numpy.ndarray
+        """
+        return ~self.consent_withdrawn
+
+    def count_raw_field_present(self, raw_field, consented_only=True):
+        """
+        :param raw_field: Raw field to count.
+        :type raw_field: str
+        :param consented_only: Whether to only count rows whose consent was not withdrawn.
+        :type consented_only: bool
+        :return: Number of rows with a non-empty value for `raw_field`.
+        :rtype: int
+        """
+        present = self.raw_field_present[raw_field]
+        if consented_only:
+            present = present & self.consented_mask()
+        return int(np.count_nonzero(present))
+
+    def count_codes(self, cc):
+        """
+        :param cc: Coding configuration to count the codes of.
+        :type cc: src.lib.pipeline_configuration.CodingConfiguration
+        :return: Number of rows with each code, in the order of the codes in cc.code_scheme.codes.
+                 Rows whose consent was withdrawn are not counted towards any code of a multi-coded configuration.
+        :rtype: numpy.ndarray
+        """
+        codes_count = len(cc.code_scheme.codes)
+        if cc.coding_mode == CodingModes.SINGLE:
+            positions = self.categorical_columns[cc.analysis_file_key]
+            return np.bincount(positions[positions >= 0], minlength=codes_count)
+        else:
+            assert cc.coding_mode == CodingModes.MULTIPLE
+            return self.matrix_columns[cc.analysis_file_key].sum(axis=0, dtype=np.int64)
@@ -0,0 +1,199 @@
+import json
+import time
+from os import path
+
+from core_data_modules.cleaners import Codes
+from core_data_modules.logging import Logger
+from core_data_modules.traced_data import Metadata
+from dateutil.parser import isoparse
+
+from src.lib.code_schemes import CodeSchemes
+from src.lib.control_code_labels import ControlCodeLabels
+from src.lib.pipeline_configuration import CodingModes, PipelineConfiguration
+
+log = Logger(__name__)
+
+MANUALLY_UNCODED_CODE_ID = "SPECIAL-MANUALLY_UNCODED"
+
+
+class CodaDatasets(object):
+    def __init__(self, coda_input_dir):
+        """
+        Loads the Coda files in a directory on demand, parsing each file at most once.
+
+        Each file is indexed as a lookup table of message id -> scheme id -> the latest label for that scheme, which
+        every stage importing labels from that file then queries, instead of re-opening and re-parsing the file once
+        per scheme.
+
+        :param coda_input_dir: Directory containing the Coda files to import labels from.
+        :type coda_input_dir: str
+        """
+        self.coda_input_dir = coda_input_dir
+        self._indices = dict()  # of coda_filename -> (dict of message id -> (dict of scheme id -> label dict))
+        self._control_code_labels = ControlCodeLabels(Metadata.get_call_location())
+
+    @staticmethod
+    def _index_messages(messages):
+        index = dict()
+        for msg in messages:
+            latest_labels = dict()
+            # Coda stores the labels for each message newest first, so the first label seen for each scheme is the
+            # latest one.
+            for label in msg["Labels"]:
+                if label["SchemeID"] not in latest_labels:
+                    latest_labels[label["SchemeID"]] = label
+            index[msg["MessageID"]] = latest_labels
+        return index
+
+    def get_latest_labels_index(self, coda_filename, missing_ok=False):
+        """
+        :param coda_filename: Name of the Coda file in the coda_input_dir to get the index of.
+        :type coda_filename: str
+        :param missing_ok: Whether to treat a Coda file which does not exist as containing no messages. If False, a
+                           FileNotFoundError is raised if the file does not exist.
+        :type missing_ok: bool
+        :return: Lookup table of message id -> scheme id -> latest label.
+        :rtype: dict of str -> (dict of str -> dict)
+        """
+        if coda_filename not in self._indices:
+            coda_input_path = path.join(self.coda_input_dir, coda_filename)
+            if path.exists(coda_input_path) or not missing_ok:
+                log.info(f"Loading Coda file '{coda_input_path}'...")
+                with open(coda_input_path, "r") as f:
+                    messages = json.load(f)
+                log.info(f"Loaded {len(messages)} Coda messages from '{coda_input_path}'")
+                self._indices[coda_filename] = self._index_messages(messages)
+            else:
+                log.warning(f"Coda file '{coda_input_path}' does not exist; treating it as containing no messages")
+                return dict()
+
+        return self._indices[coda_filename]
+
+    def import_labels_to_traced_data_iterable(self, user, data, message_id_key, coda_filename, scheme_key_map,
+                                              missing_ok=False):
+        """
+        Codes keys in an iterable of TracedData objects using the latest labels from a Coda file.
+
+        Keys whose latest label in Coda has not been checked, or which have no label at all, are labelled
+        Codes.NOT_REVIEWED.
+
+        :param user: Identifier of the user running this program, for TracedData Metadata.
+        :type user: str
+        :param data: TracedData objects to be coded using the Coda file.
+        :type data: iterable of TracedData
+        :param message_id_key: Key in TracedData objects of the message ids.
+        :type message_id_key: str
+        :param coda_filename: Name of the Coda file in the coda_input_dir to import labels from.
+        :type coda_filename: str
+        :param scheme_key_map: Dictionary of (key in TracedData objects to assign labels to) ->
+                               (Scheme in the Coda file to retrieve the labels from)
+        :type scheme_key_map: dict of str -> core_data_modules.data_models.CodeScheme
+        :param missing_ok: Whether to treat a Coda file which does not exist as containing no messages, so that every
+                           key is labelled from the TracedData alone. If False, a FileNotFoundError is raised if the
+                           file does not exist.
+        :type missing_ok: bool
+        """
+        index = self.get_latest_labels_index(coda_filename, missing_ok)
+
+        for td in data:
+            if message_id_key not in td:
+                continue
+
+            latest_labels = index.get(td[message_id_key], dict())
+            labels_dict = dict()
+            for coded_key, scheme in scheme_key_map.items():
+                label = latest_labels.get(scheme.scheme_id, td.get(coded_key))
+                if label is None or label["CodeID"] == MANUALLY_UNCODED_CODE_ID or not label.get("Checked", False):
+                    label = self._control_code_labels.get_label(scheme, Codes.NOT_REVIEWED)
+                labels_dict[coded_key] = label
+
+            td.append_data(labels_dict, Metadata(user, Metadata.get_call_location(), time.time()))
+
+    def import_labels_to_traced_data_iterable_multi_coded(self, user, data, message_id_key, coda_filename,
+                                                          scheme_key_map, missing_ok=False):
+        """
+        Codes keys in an iterable of TracedData objects using the latest labels from a Coda file, for multi-coded
+        schemes.
+
+        Only the 'primary' schemes should be passed in. Labels from schemes that were duplicated in Coda (which have ids
+        of the form "<primary scheme id>-<n>") are collected together with the primary scheme's labels.
+        Keys with no checked labels are labelled [Codes.NOT_REVIEWED].
+
+        :param user: Identifier of the user running this program, for TracedData Metadata.
+        :type user: str
+        :param data: TracedData objects to be coded using the Coda file.
+        :type data: iterable of TracedData
+        :param message_id_key: Key in TracedData objects of the message ids.
+        :type message_id_key: str
+        :param coda_filename: Name of the Coda file in the coda_input_dir to import labels from.
+        :type coda_filename: str
+        :param scheme_key_map: Dictionary of (key in TracedData objects to assign labels to) ->
+                               (Primary scheme in the Coda file to retrieve the labels from)
+        :type scheme_key_map: dict of str -> core_data_modules.data_models.CodeScheme
+        :param missing_ok: Whether to treat a Coda file which does not exist as containing no messages, so that every
+                           key is labelled from the TracedData alone. If False, a FileNotFoundError is raised if the
+                           file does not exist.
+        :type missing_ok: bool
+        """
+        index = self.get_latest_labels_index(coda_filename, missing_ok)
+
+        for td in data:
+            if message_id_key not in td:
+                continue
+
+            latest_labels = index.get(td[message_id_key], dict())
+            labels_dict = dict()
+            for coded_key, scheme in scheme_key_map.items():
+                coda_labels = [label for scheme_id, label in latest_labels.items()
+                               if scheme_id == scheme.scheme_id or scheme_id.startswith(f"{scheme.scheme_id}-")]
+                coda_labels.sort(key=lambda label: isoparse(label["DateTimeUTC"]))
+
+                # Start from the labels currently in the TracedData, then overwrite each (virtual) scheme's label with
+                # the latest one from Coda.
+                labels_lut = {label["SchemeID"]: label for label in td.get(coded_key, [])}
+                for label in coda_labels:
+                    labels_lut[label["SchemeID"]] = label
+
+                labels = [label for label in labels_lut.values() if label["CodeID"] != MANUALLY_UNCODED_CODE_ID]
+                if not any(label.get("Checked", False) for label in labels):
+                    labels = [self._control_code_labels.get_label(scheme, Codes.NOT_REVIEWED)]
+                labels_dict[coded_key] = labels
+
+            td.append_data(labels_dict, Metadata(user, Metadata.get_call_location(), time.time()))
+
+    def import_plan_labels_to_traced_data_iterable(self, user, data, coda_filename, key_suffix="", missing_ok=False):
+        """
+        Codes the coded fields and the correct dataset field of the coding plan of a Coda file, in an iterable of
+        TracedData objects, using the latest labels from that Coda file.
+
+        :param user: Identifier of the user running this program, for TracedData Metadata.
+        :type user: str
+        :param data: TracedData objects to be coded using the Coda file.
+        :type data: iterable of TracedData
+        :param coda_filename: Name of the Coda file in the coda_input_dir to import labels from. This must be the
+                              coda_filename of one of the coding plans in PipelineConfiguration.PLAN_REGISTRY.
+        :type coda_filename: str
+        :param key_suffix: Suffix to append to the plan's message id key, and to each key to assign labels to.
+        :type key_suffix: str
+        :param missing_ok: Whether to treat a Coda file which does not exist as containing no messages.
+                           See import_labels_to_traced_data_iterable.
+        :type missing_ok: bool
+        """
+        plan = PipelineConfiguration.PLAN_REGISTRY.get_plan_by_coda_filename(coda_filename)
+        assert plan is not None, f"No coding plan has the Coda filename '{coda_filename}'"
+
+        single_coded_scheme_key_map = {f"{plan.raw_field}{key_suffix}_correct_dataset": CodeSchemes.WS_CORRECT_DATASET}
+        multi_coded_scheme_key_map = dict()
+        for cc in plan.coding_configurations:
+            if cc.coding_mode == CodingModes.SINGLE:
+                single_coded_scheme_key_map[f"{cc.coded_field}{key_suffix}"] = cc.code_scheme
+            else:
+                assert cc.coding_mode == CodingModes.MULTIPLE
+                multi_coded_scheme_key_map[f"{cc.coded_field}{key_suffix}"] = cc.code_scheme
+
+        message_id_key = f"{plan.id_field}{key_suffix}"
+        self.import_labels_to_traced_data_iterable(
+            user, data, message_id_key, coda_filename, single_coded_scheme_key_map, missing_ok)
+        if len(multi_coded_scheme_key_map) > 0:
+            self.import_labels_to_traced_data_iterable_multi_coded(
+                user, data, message_id_key, coda_filename, multi_coded_scheme_key_map, missing_ok)
@@ -1,5 +1,3 @@
-import time
-
 from core_data_modules.cleaners import Codes
 from core_data_modules.cleaners.cleaning_utils import CleaningUtils
 from core_data_modules.cleaners.location_tools import SomaliaLocations
@@ -16,87 +14,134 @@ def make_location_code(scheme, clean_value):
         return scheme.get_code_with_match_value(clean_value)
 
 
-def impute_somalia_location_codes(user, data, location_configurations):
-    for td in data:
-        # Up to 1 location code should have been assigned in Coda. Search for that code,
-        # ensuring that only 1 has been assigned or, if multiple have been assigned, that they are non-conflicting
-        # control codes
-        location_code = None
+class _SomaliaLocationLabels(object):
+    """
+    Lookup tables of the labels imputed from each location code and operator, built the first time each code is
+    seen, so that the location hierarchy is only resolved and each imputed label only built once per code rather than
+    once per message.
 
-        for cc in location_configurations:
-            coda_code = cc.code_scheme.get_code_with_code_id(td[cc.coded_field]["CodeID"])
-            if location_code is not None:
-                if not (
-                        coda_code.code_id == location_code.code_id or coda_code.control_code == Codes.NOT_REVIEWED):
-                    location_code = CodeSchemes.MOGADISHU_SUB_DISTRICT.get_code_with_control_code(Codes.CODING_ERROR)
-            elif coda_code.control_code != Codes.NOT_REVIEWED:
-                location_code = coda_code
-
-        # If no code was found, then this location is still not reviewed.
-        # Synthesise a NOT_REVIEWED code accordingly.
-        if location_code is None:
-            location_code = CodeSchemes.MOGADISHU_SUB_DISTRICT.get_code_with_control_code(Codes.NOT_REVIEWED)
-
-        # If a control code was found, set all other location keys to that control code,
-        # otherwise convert the provided location to the other locations in the hierarchy.
-        if location_code.code_type == CodeTypes.CONTROL:
-            for cc in location_configurations:
-                td.append_data({
-                    cc.coded_field: CleaningUtils.make_label_from_cleaner_code(
-                        cc.code_scheme,
-                        cc.code_scheme.get_code_with_control_code(location_code.control_code),
-                        Metadata.get_call_location()
-                    ).to_dict()
-                }, Metadata(user, Metadata.get_call_location(), time.time()))
-        elif location_code.code_type == CodeTypes.META:
-            for cc in location_configurations:
-                td.append_data({
-                    cc.coded_field: CleaningUtils.make_label_from_cleaner_code(
-                        cc.code_scheme,
-                        cc.code_scheme.get_code_with_meta_code(location_code.meta_code),
-                        Metadata.get_call_location()
-                    ).to_dict()
-                }, Metadata(user, Metadata.get_call_location(), time.time()))
-        else:
-            assert location_code.code_type == CodeTypes.NORMAL
-            location = location_code.match_values[0]
-            td.append_data({
+    The labels are shared by every message they are imputed for, and so must not be modified.
+    """
+    _location_labels = dict()  # of location -> (dict of coded field -> label dict)
+    _meta_code_labels = dict()  # of (scheme id, meta code) -> label dict
+    _operator_zone_labels = dict()  # of operator code id -> label dict
+
+    @classmethod
+    def get_location_labels(cls, location):
+        """
+        :param location: Location code e.g. a match value of a code in CodeSchemes.SOMALIA_DISTRICT.
+        :type location: str
+        :return: Dictionary of coded field -> label for each of the location fields in the hierarchy.
+        :rtype: dict of str -> dict
+        """
+        if location not in cls._location_labels:
+            origin = Metadata.get_call_location()
+            cls._location_labels[location] = {
                 "mogadishu_sub_district_coded": CleaningUtils.make_label_from_cleaner_code(
                     CodeSchemes.MOGADISHU_SUB_DISTRICT,
                     make_location_code(CodeSchemes.MOGADISHU_SUB_DISTRICT,
                                        SomaliaLocations.mogadishu_sub_district_for_location_code(location)),
-                    Metadata.get_call_location()).to_dict(),
+                    origin).to_dict(),
                 "district_coded": CleaningUtils.make_label_from_cleaner_code(
                     CodeSchemes.SOMALIA_DISTRICT,
                     make_location_code(CodeSchemes.SOMALIA_DISTRICT,
                                        SomaliaLocations.district_for_location_code(location)),
-                    Metadata.get_call_location()).to_dict(),
+                    origin).to_dict(),
                 "region_coded": CleaningUtils.make_label_from_cleaner_code(
                     CodeSchemes.SOMALIA_REGION,
                     make_location_code(CodeSchemes.SOMALIA_REGION,
                                        SomaliaLocations.region_for_location_code(location)),
-                    Metadata.get_call_location()).to_dict(),
+                    origin).to_dict(),
                 "state_coded": CleaningUtils.make_label_from_cleaner_code(
                     CodeSchemes.SOMALIA_STATE,
                     make_location_code(CodeSchemes.SOMALIA_STATE,
                                        SomaliaLocations.state_for_location_code(location)),
-                    Metadata.get_call_location()).to_dict(),
+                    origin).to_dict(),
                 "zone_coded": CleaningUtils.make_label_from_cleaner_code(
                     CodeSchemes.SOMALIA_ZONE,
                     make_location_code(CodeSchemes.SOMALIA_ZONE,
                                        SomaliaLocations.zone_for_location_code(location)),
-                    Metadata.get_call_location()).to_dict()
-            }, Metadata(user, Metadata.get_call_location(), time.time()))
+                    origin).to_dict()
+            }
+        return cls._location_labels[location]
 
-        # Impute zone from operator
-        if "location_raw" not in td:
-            operator_str = CodeSchemes.SOMALIA_OPERATOR.get_code_with_code_id(td["operator_coded"]["CodeID"]).string_value
+    @classmethod
+    def get_meta_code_label(cls, scheme, meta_code):
+        """
+        :param scheme: Code scheme to get the label of.
+        :type scheme: core_data_modules.data_models.CodeScheme
+        :param meta_code: Meta code to get the label of.
+        :type meta_code: str
+        :return: Serialized label for `scheme`'s code with the given meta code.
+        :rtype: dict
+        """
+        key = (scheme.scheme_id, meta_code)
+        if key not in cls._meta_code_labels:
+            cls._meta_code_labels[key] = CleaningUtils.make_label_from_cleaner_code(
+                scheme, scheme.get_code_with_meta_code(meta_code), Metadata.get_call_location()
+            ).to_dict()
+        return cls._meta_code_labels[key]
+
+    @classmethod
+    def get_operator_zone_label(cls, operator_code_id):
+        """
+        :param operator_code_id: Id of a code in CodeSchemes.SOMALIA_OPERATOR.
+        :type operator_code_id: str
+        :return: Serialized label for the zone imputed from the operator.
+        :rtype: dict
+        """
+        if operator_code_id not in cls._operator_zone_labels:
+            operator_str = CodeSchemes.SOMALIA_OPERATOR.get_code_with_code_id(operator_code_id).string_value
             zone_str = SomaliaLocations.zone_for_operator_code(operator_str)
 
-            td.append_data({
-                "zone_coded": CleaningUtils.make_label_from_cleaner_code(
-                    CodeSchemes.SOMALIA_ZONE,
-                    make_location_code(CodeSchemes.SOMALIA_ZONE,
-                                       SomaliaLocations.state_for_location_code(zone_str)),
-                    Metadata.get_call_location()).to_dict()
-            }, Metadata(user, Metadata.get_call_location(), time.time()))
+            cls._operator_zone_labels[operator_code_id] = CleaningUtils.make_label_from_cleaner_code(
+                CodeSchemes.SOMALIA_ZONE,
+                make_location_code(CodeSchemes.SOMALIA_ZONE,
+                                   SomaliaLocations.state_for_location_code(zone_str)),
+                Metadata.get_call_location()).to_dict()
+        return cls._operator_zone_labels[operator_code_id]
+
+
+# Code imputation functions take a message, the coding configurations of the plan they are configured for, and a
+# ControlCodeLabels table, and return a dictionary of (coded field -> imputed label(s)) to update the message with.
+def impute_somalia_location_codes(td, location_configurations, control_code_labels):
+    imputed_codes = dict()
+
+    # Up to 1 location code should have been assigned in Coda. Search for that code,
+    # ensuring that only 1 has been assigned or, if multiple have been assigned, that they are non-conflicting
+    # control codes
+    location_code = None
+
+    for cc in location_configurations:
+        coda_code = cc.code_scheme.get_code_with_code_id(td[cc.coded_field]["CodeID"])
+        if location_code is not None:
+            if not (
+                    coda_code.code_id == location_code.code_id or coda_code.control_code == Codes.NOT_REVIEWED):
+                location_code = CodeSchemes.MOGADISHU_SUB_DISTRICT.get_code_with_control_code(Codes.CODING_ERROR)
+        elif coda_code.control_code != Codes.NOT_REVIEWED:
+            location_code = coda_code
+
+    # If no code was found, then this location is still not reviewed.
+    # Synthesise a NOT_REVIEWED code accordingly.
+    if location_code is None:
+        location_code = CodeSchemes.MOGADISHU_SUB_DISTRICT.get_code_with_control_code(Codes.NOT_REVIEWED)
+
+    # If a control code was found, set all other location keys to that control code,
+    # otherwise convert the provided location to the other locations in the hierarchy.
+    if location_code.code_type == CodeTypes.CONTROL:
+        for cc in location_configurations:
+            imputed_codes[cc.coded_field] = control_code_labels.get_label(cc.code_scheme, location_code.control_code)
+    elif location_code.code_type == CodeTypes.META:
+        for cc in location_configurations:
+            imputed_codes[cc.coded_field] = _SomaliaLocationLabels.get_meta_code_label(
+                cc.code_scheme, location_code.meta_code)
+    else:
+        assert location_code.code_type == CodeTypes.NORMAL
+        location = location_code.match_values[0]
+        imputed_codes.update(_SomaliaLocationLabels.get_location_labels(location))
+
+    # Impute zone from operator
+    if "location_raw" not in td:
+        imputed_codes["zone_coded"] = _SomaliaLocationLabels.get_operator_zone_label(td["operator_coded"]["CodeID"])
+
+    return imputed_codes
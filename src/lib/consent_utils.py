@@ -7,8 +7,23 @@ from src.lib.pipeline_configuration import CodingModes
 
 
 class ConsentUtils(object):
-    @staticmethod
-    def td_has_stop_code(td, coding_plans):
+    _stop_code_ids = dict()  # of scheme id -> frozenset of the ids of the scheme's Codes.STOP codes
+
+    @classmethod
+    def get_stop_code_ids(cls, code_scheme):
+        """
+        :param code_scheme: Code scheme to get the stop code ids of.
+        :type code_scheme: core_data_modules.data_models.CodeScheme
+        :return: Ids of the codes in the given scheme which have control code Codes.STOP.
+        :rtype: frozenset of str
+        """
+        if code_scheme.scheme_id not in cls._stop_code_ids:
+            cls._stop_code_ids[code_scheme.scheme_id] = frozenset(
+                code.code_id for code in code_scheme.codes if code.control_code == Codes.STOP)
+        return cls._stop_code_ids[code_scheme.scheme_id]
+
+    @classmethod
+    def td_has_stop_code(cls, td, coding_plans):
         """
         Returns whether any of the values for the given keys are Codes.STOP in the given TracedData object.
 
@@ -22,13 +37,36 @@ class ConsentUtils(object):
         for plan in coding_plans:
             for cc in plan.coding_configurations:
                 if cc.coding_mode == CodingModes.SINGLE:
-                    if cc.code_scheme.get_code_with_code_id(td[cc.coded_field]["CodeID"]).control_code == Codes.STOP:
+                    if td[cc.coded_field]["CodeID"] in cls.get_stop_code_ids(cc.code_scheme):
                         return True
                 else:
-                    if td[f"{cc.analysis_file_key}{Codes.STOP}"] == Codes.MATRIX_1:
-                        return True
+                    stop_code_ids = cls.get_stop_code_ids(cc.code_scheme)
+                    for label in td.get(cc.coded_field, []):
+                        if label["CodeID"] in stop_code_ids:
+                            return True
         return False
 
+    @classmethod
+    def get_stopped_uids(cls, data, coding_plans):
+        """
+        Finds the uids of the participants who sent a message coded as Codes.STOP, in a single pass over the data.
+
+        Messages from a uid which is already known to be stopped are not searched.
+
+        :param data: TracedData objects to search for stop codes.
+        :type data: iterable of TracedData
+        :param coding_plans: Coding plans whose coded fields to search for stop codes.
+        :type coding_plans: iterable of CodingPlan
+        :return: Uids of the participants who withdrew consent.
+        :rtype: set of str
+        """
+        coding_plans = list(coding_plans)
+        stopped_uids = set()
+        for td in data:
+            if td["uid"] not in stopped_uids and cls.td_has_stop_code(td, coding_plans):
+                stopped_uids.add(td["uid"])
+        return stopped_uids
+
     @classmethod
     def determine_consent_withdrawn(cls, user, data, coding_plans, withdrawn_key="consent_withdrawn"):
         """
@@ -48,10 +86,7 @@ class ConsentUtils(object):
         :param withdrawn_key: Name of key to use for the consent withdrawn field.
         :type withdrawn_key: str
         """
-        stopped_uids = set()
-        for td in data:
-            if cls.td_has_stop_code(td, coding_plans):
-                stopped_uids.add(td["uid"])
+        stopped_uids = cls.get_stopped_uids(data, coding_plans)
 
         for td in data:
             if td["uid"] in stopped_uids:
@@ -66,10 +101,14 @@ class ConsentUtils(object):
         For each TracedData object in an iterable whose 'withdrawn_key' is Codes.True, sets every other key to
         Codes.STOP. If there is no withdrawn_key or the value is not Codes.True, that TracedData object is not modified.
 
+        The keys of all the TracedData objects of each stopped uid are set to Codes.STOP in every one of them, so
+        that a single dict of stopped keys is built per uid and shared by all of that uid's TracedData objects,
+        rather than one being built per TracedData object.
+
         :param user: Identifier of the user running this program, for TracedData Metadata.
         :type user: str
         :param data: TracedData objects to set to stopped if consent has been withdrawn.
-        :type data: iterable of TracedData
+        :type data: list of TracedData
         :param withdrawn_key: Key in each TracedData object which indicates whether consent has been withdrawn.
         :type withdrawn_key: str
         :param additional_keys: Additional keys to set to 'STOP' (e.g. keys not already in some TracedData objects)
@@ -78,7 +117,22 @@ class ConsentUtils(object):
         if additional_keys is None:
             additional_keys = []
 
+        stop_dicts = dict()  # of uid -> (dict of key -> Codes.STOP), with the keys in the order they are first seen
+        for td in data:
+            if td.get(withdrawn_key) == Codes.TRUE:
+                if td["uid"] not in stop_dicts:
+                    stop_dicts[td["uid"]] = dict()
+                stop_dict = stop_dicts[td["uid"]]
+                for key in td.keys():
+                    stop_dict[key] = Codes.STOP
+
+        for stop_dict in stop_dicts.values():
+            for key in additional_keys:
+                stop_dict[key] = Codes.STOP
+            stop_dict.pop(withdrawn_key, None)
+
+        # The stop dicts are shared by all the TracedData objects of their uid, so must not be modified after this.
+
         for td in data:
             if td.get(withdrawn_key) == Codes.TRUE:
-                stop_dict = {key: Codes.STOP for key in list(td.keys()) + additional_keys if key != withdrawn_key}
-                td.append_data(stop_dict, Metadata(user, Metadata.get_call_location(), time.time()))
+                td.append_data(stop_dicts[td["uid"]], Metadata(user, Metadata.get_call_location(), time.time()))
@@ -0,0 +1,35 @@
+from core_data_modules.cleaners.cleaning_utils import CleaningUtils
+
+
+class ControlCodeLabels(object):
+    def __init__(self, origin_id):
+        """
+        Table of prebuilt labels for the control codes of code schemes, for stages which assign the same control code
+        label (e.g. TRUE_MISSING, NOT_CODED, CODING_ERROR) to many messages.
+
+        Each label is built the first time it is requested and then shared by every message it is assigned to, so all
+        the labels in a table have the same origin and timestamp. The shared label dicts must not be modified.
+
+        :param origin_id: Identifier of the origin of the labels in this table, e.g. Metadata.get_call_location() in
+                          the stage which creates it.
+        :type origin_id: str
+        """
+        self.origin_id = origin_id
+        self._labels = dict()  # of (scheme id, control code) -> label dict
+
+    def get_label(self, scheme, control_code):
+        """
+        :param scheme: Code scheme to get the label of.
+        :type scheme: core_data_modules.data_models.CodeScheme
+        :param control_code: Control code to get the label of e.g. Codes.NOT_CODED.
+        :type control_code: str
+        :return: Serialized label for `scheme`'s code with the given control code.
+        :rtype: dict
+        """
+        key = (scheme.scheme_id, control_code)
+        if key not in self._labels:
+            self._labels[key] = CleaningUtils.make_label_from_cleaner_code(
+                scheme, scheme.get_code_with_control_code(control_code), self.origin_id
+            ).to_dict()
+        return self._labels[key]
+
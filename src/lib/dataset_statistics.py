@@ -0,0 +1,105 @@
+import json
+from collections import OrderedDict
+
+from core_data_modules.logging import Logger
+
+from src.lib.pipeline_configuration import PipelineConfiguration
+
+log = Logger(__name__)
+
+
+class _FieldCounts(object):
+    def __init__(self):
+        self.total = 0
+        self.empty_string = 0
+        self.null = 0
+
+    def add(self, value):
+        self.total += 1
+        if value == "":
+            self.empty_string += 1
+        elif value is None:
+            self.null += 1
+
+    def to_dict(self):
+        return {
+            "Total": self.total,
+            "EmptyString": self.empty_string,
+            "Null": self.null
+        }
+
+
+class DatasetStatistics(object):
+    def __init__(self):
+        """
+        Collects data-volume statistics about the dataset at different stages of the pipeline, for logging and for
+        export to a JSON statistics file.
+
+        Each stage's statistics are collected in a single pass over the data.
+        """
+        self._stages = OrderedDict()  # of stage name -> statistics dict
+
+    def collect(self, stage_name, data, message_index=None):
+        """
+        Collects statistics about the given data, and logs a summary.
+
+        Computes, for each RQA raw field, the number of messages which contain the field and how many of those were
+        the empty string or null, and, for each survey raw field, the same counts per individual.
+
+        :param stage_name: Name of the pipeline stage to record these statistics under.
+        :type stage_name: str
+        :param data: TracedData objects to collect the statistics of.
+        :type data: iterable of TracedData
+        :param message_index: Index of the RQA raw fields in `data`. If provided, the RQA field statistics are counted
+                              from the messages in the index rather than by testing every message for every field,
+                              and `data` must be the list of messages the index was built from.
+        :type message_index: src.lib.MessageIndex | None
+        """
+        rqa_fields = PipelineConfiguration.PLAN_REGISTRY.rqa_raw_fields
+        survey_fields = PipelineConfiguration.PLAN_REGISTRY.survey_raw_fields
+
+        messages_count = 0
+        rqa_counts = OrderedDict((field, _FieldCounts()) for field in rqa_fields)
+        latest_survey_values = dict()  # of uid -> (dict of survey field -> value)
+        if message_index is not None:
+            message_index.assert_indexes(data)
+            for field, counts in rqa_counts.items():
+                for td in message_index.get_messages(field):
+                    counts.add(td[field])
+
+        for td in data:
+            messages_count += 1
+            if message_index is None:
+                for field, counts in rqa_counts.items():
+                    if field in td:
+                        counts.add(td[field])
+            # The survey data is the same for every message from an individual, so only the values in the last
+            # message seen for each uid need to be kept.
+            latest_survey_values[td["uid"]] = {field: td[field] for field in survey_fields if field in td}
+
+        survey_counts = OrderedDict((field, _FieldCounts()) for field in survey_fields)
+        for survey_values in latest_survey_values.values():
+            for field, value in survey_values.items():
+                survey_counts[field].add(value)
+
+        log.debug(f"{stage_name}: {messages_count} messages from {len(latest_survey_values)} individuals")
+        for field, counts in list(rqa_counts.items()) + list(survey_counts.items()):
+            log.debug(f"{stage_name}: {field}: {counts.empty_string} messages were \"\" and {counts.null} were null, "
+                      f"out of {counts.total} total")
+
+        self._stages[stage_name] = {
+            "Messages": messages_count,
+            "Individuals": len(latest_survey_values),
+            "MessagesPerShow": OrderedDict((field, counts.total) for field, counts in rqa_counts.items()),
+            "RQAFields": OrderedDict((field, counts.to_dict()) for field, counts in rqa_counts.items()),
+            "SurveyFields": OrderedDict((field, counts.to_dict()) for field, counts in survey_counts.items())
+        }
+
+    def export_to_json(self, f):
+        """
+        Writes the statistics collected so far to a JSON file.
+
+        :param f: File to write the statistics to.
+        :type f: file-like
+        """
+        json.dump({"Stages": self._stages}, f, indent=2)
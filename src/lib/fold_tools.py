@@ -0,0 +1,241 @@
+import operator
+import time
+from collections import OrderedDict
+from functools import reduce
+
+from core_data_modules.cleaners import Codes
+from core_data_modules.traced_data import Metadata
+
+from src.lib.matrix_bitsets import MatrixBitsets
+
+YES_NO_AMB_CODES = {Codes.YES, Codes.NO, Codes.AMBIVALENT}
+
+
+class FoldTools(object):
+    """
+    Folds groups of TracedData into a single TracedData per group, computing each folded value directly from all the
+    values in its group rather than by folding the TracedData pairwise.
+    """
+
+    @staticmethod
+    def fold_equal_values(key, values):
+        """
+        :param key: Key the values are for, for use in the error message if the values are not all equal.
+        :type key: str
+        :param values: Values to fold.
+        :type values: list
+        :return: The value, which must be the same for every item in `values`.
+        """
+        value = values[0]
+        for other_value in values[1:]:
+            assert other_value == value, f"Key '{key}' should be the same in all the TracedData being folded but " \
+                                         f"is different (has values '{value}' and '{other_value}')"
+        return value
+
+    @staticmethod
+    def fold_concat_values(values, concat_delimiter=";"):
+        """
+        :param values: Values to fold.
+        :type values: list
+        :param concat_delimiter: Delimiter to separate the values with.
+        :type concat_delimiter: str
+        :return: The values which are not None joined by `concat_delimiter`, or None if all the values are None.
+        :rtype: str | None
+        """
+        values = [str(value) for value in values if value is not None]
+        if len(values) == 0:
+            return None
+        return concat_delimiter.join(values)
+
+    @staticmethod
+    def fold_matrix_values(values):
+        """
+        :param values: Values to fold.
+        :type values: list
+        :return: Codes.MATRIX_1 if any of the values are Codes.MATRIX_1, otherwise Codes.MATRIX_0.
+        :rtype: str
+        """
+        return Codes.MATRIX_1 if Codes.MATRIX_1 in values else Codes.MATRIX_0
+
+    @staticmethod
+    def fold_bitset_values(values):
+        """
+        :param values: Integer bitsets to fold. None values are ignored.
+        :type values: list of (int | None)
+        :return: The bitwise OR of the bitsets.
+        :rtype: int
+        """
+        return reduce(operator.or_, [value for value in values if value is not None], 0)
+
+    @classmethod
+    def fold_matrix_bitset_values(cls, code_scheme, values, folded_raw_value):
+        """
+        Folds the matrix bitsets of a multi-coded field (see MatrixBitsets) with a bitwise OR, then corrects the
+        control codes of the folded bitset, which can't be folded code by code when the TracedData being folded are
+        answers to different radio shows:
+         - Codes.TRUE_MISSING is removed if the folded raw value is not empty.
+         - Codes.NOT_CODED is set if no other code is.
+
+        :param code_scheme: Code scheme of the multi-coded field.
+        :type code_scheme: core_data_modules.data_models.CodeScheme
+        :param values: Integer bitsets to fold. None values are ignored.
+        :type values: list of (int | None)
+        :param folded_raw_value: Folded value of the raw field the multi-coded field is the coding of.
+        :type folded_raw_value: str | None
+        :return: The folded bitset.
+        :rtype: int
+        """
+        bitset = cls.fold_bitset_values(values)
+
+        if folded_raw_value is not None and folded_raw_value != "":
+            bitset &= ~MatrixBitsets.get_control_code_mask(code_scheme, Codes.TRUE_MISSING)
+
+        nc_mask = MatrixBitsets.get_control_code_mask(code_scheme, Codes.NOT_CODED)
+        if bitset & ~nc_mask == 0:
+            bitset |= nc_mask
+
+        return bitset
+
+    @staticmethod
+    def fold_bool_values(values):
+        """
+        :param values: Values to fold.
+        :type values: list
+        :return: Codes.TRUE if any of the values are Codes.TRUE, otherwise Codes.FALSE.
+        :rtype: str
+        """
+        return Codes.TRUE if Codes.TRUE in values else Codes.FALSE
+
+    @staticmethod
+    def _fold_yes_no_amb_value_pair(value_1, value_2):
+        if value_1 == value_2:
+            return value_1
+
+        if value_1 in YES_NO_AMB_CODES and value_2 in YES_NO_AMB_CODES:
+            return Codes.AMBIVALENT
+
+        # A yes/no/ambivalent answer takes precedence over a control code, and any control code takes precedence
+        # over a missing value.
+        if value_1 in YES_NO_AMB_CODES:
+            return value_1
+        if value_2 in YES_NO_AMB_CODES:
+            return value_2
+        if value_1 in {None, Codes.TRUE_MISSING}:
+            return value_2
+        if value_2 in {None, Codes.TRUE_MISSING}:
+            return value_1
+        return Codes.NOT_CODED
+
+    @classmethod
+    def fold_yes_no_amb_values(cls, values):
+        """
+        :param values: Values to fold.
+        :type values: list
+        :return: Codes.YES if all the yes/no/ambivalent values are Codes.YES, Codes.NO if they are all Codes.NO,
+                 otherwise Codes.AMBIVALENT. If none of the values are yes/no/ambivalent, returns the control code
+                 if there is only one, otherwise Codes.NOT_CODED.
+        :rtype: str | None
+        """
+        return reduce(cls._fold_yes_no_amb_value_pair, values)
+
+    @staticmethod
+    def group_by(data, fold_id_fn):
+        """
+        :param data: TracedData objects to group.
+        :type data: iterable of TracedData
+        :param fold_id_fn: Function which returns the id of the group each TracedData object belongs to.
+        :type fold_id_fn: function of TracedData -> hashable
+        :return: Groups of TracedData objects, in the order each group's first TracedData appears in `data`.
+        :rtype: list of (list of TracedData)
+        """
+        groups = OrderedDict()
+        for td in data:
+            fold_id = fold_id_fn(td)
+            if fold_id not in groups:
+                groups[fold_id] = []
+            groups[fold_id].append(td)
+        return list(groups.values())
+
+    @staticmethod
+    def _fold_traced_data(user, td, folded_keys, folded_dict):
+        """
+        :return: A copy of `td` with the keys which weren't folded hidden and the folded values appended.
+        :rtype: TracedData
+        """
+        td = td.copy()
+        td.hide_keys(set(td.keys()) - folded_keys, Metadata(user, Metadata.get_call_location(), time.time()))
+        td.append_data(folded_dict, Metadata(user, Metadata.get_call_location(), time.time()))
+        return td
+
+    @classmethod
+    def fold_iterable_of_traced_data(cls, user, data, fold_id_fn, equal_keys=None, concat_keys=None, matrix_keys=None,
+                                     bool_keys=None, binary_keys=None, bitset_keys=None):
+        """
+        Folds an iterable of TracedData into a single TracedData for each group of objects with the same fold id,
+        with the same semantics as core_data_modules.traced_data.util.FoldTracedData.fold_iterable_of_traced_data
+        (plus bitset_keys), but computing each folded value once from all the values in its group.
+
+        Groups of one TracedData are not folded, so are returned as a copy of that TracedData, with all its keys.
+        For larger groups, the folded TracedData is a copy of the first TracedData in the group, with the keys which
+        are not folded hidden and the folded values appended. Each of the other TracedData in the group is appended to
+        it under the key "folded_with", in the same way, so the folded TracedData's history links to every message it
+        was folded from.
+
+        :param user: Identifier of the user running this program, for TracedData Metadata.
+        :type user: str
+        :param data: TracedData objects to fold.
+        :type data: iterable of TracedData
+        :param fold_id_fn: Function which returns the id to fold each TracedData object by.
+        :type fold_id_fn: function of TracedData -> hashable
+        :param equal_keys: Keys which must have the same value in every TracedData in a group.
+        :type equal_keys: list of str | None
+        :param concat_keys: Keys whose values are joined with ';'.
+        :type concat_keys: list of str | None
+        :param matrix_keys: Keys which are Codes.MATRIX_1 if any value in a group is Codes.MATRIX_1.
+        :type matrix_keys: list of str | None
+        :param bool_keys: Keys which are Codes.TRUE if any value in a group is Codes.TRUE.
+        :type bool_keys: list of str | None
+        :param binary_keys: Keys containing yes/no/ambivalent codes. See FoldTools.fold_yes_no_amb_values.
+        :type binary_keys: list of str | None
+        :param bitset_keys: Keys containing integer bitsets, which are folded with a bitwise OR.
+        :type bitset_keys: list of str | None
+        :return: Folded TracedData objects, in the order each fold id first appears in `data`.
+        :rtype: list of TracedData
+        """
+        # (key, function of list of values -> folded value, whether the folded value is only appended if not None).
+        # Equal and concatenated keys whose folded value is None keep the first TracedData's value instead, as in
+        # FoldTracedData.
+        key_folders = []
+        for key in equal_keys or []:
+            key_folders.append((key, lambda values, key=key: cls.fold_equal_values(key, values), True))
+        for key in concat_keys or []:
+            key_folders.append((key, cls.fold_concat_values, True))
+        for key in matrix_keys or []:
+            key_folders.append((key, cls.fold_matrix_values, False))
+        for key in bool_keys or []:
+            key_folders.append((key, cls.fold_bool_values, False))
+        for key in binary_keys or []:
+            key_folders.append((key, cls.fold_yes_no_amb_values, False))
+        for key in bitset_keys or []:
+            key_folders.append((key, cls.fold_bitset_values, False))
+
+        folded_keys = {key for key, _, _ in key_folders}
+
+        folded_data = []
+        for group in cls.group_by(data, fold_id_fn):
+            if len(group) == 1:
+                folded_data.append(group[0].copy())
+                continue
+
+            folded_dict = dict()
+            for key, fold_values, omit_none in key_folders:
+                folded_value = fold_values([td.get(key) for td in group])
+                if folded_value is not None or not omit_none:
+                    folded_dict[key] = folded_value
+
+            folded_td = cls._fold_traced_data(user, group[0], folded_keys, folded_dict)
+            for td in group[1:]:
+                folded_td.append_traced_data("folded_with", cls._fold_traced_data(user, td, folded_keys, folded_dict),
+                                             Metadata(user, Metadata.get_call_location(), time.time()))
+            folded_data.append(folded_td)
+        return folded_data
@@ -5,17 +5,66 @@ from core_data_modules.logging import Logger
 log = Logger(__name__)
 
 
+class ReservoirSampler(object):
+    def __init__(self, sample_size, random_generator=None):
+        """
+        Draws a uniform random sample of a fixed size from a stream of items of unknown length, in one pass and using
+        memory proportional to the sample size (reservoir sampling, 'Algorithm R').
+
+        :param sample_size: Number of items to sample.
+        :type sample_size: int
+        :param random_generator: Random generator to use to draw the sample. If None, uses the `random` module.
+                                 Pass a seeded random.Random for a reproducible sample.
+        :type random_generator: random.Random | None
+        """
+        if random_generator is None:
+            random_generator = random
+
+        self.sample_size = sample_size
+        self.random_generator = random_generator
+        self.items_seen = 0
+        self._reservoir = []
+
+    def add(self, item):
+        self.items_seen += 1
+        if len(self._reservoir) < self.sample_size:
+            self._reservoir.append(item)
+        else:
+            i = self.random_generator.randrange(self.items_seen)
+            if i < self.sample_size:
+                self._reservoir[i] = item
+
+    def get_sample(self):
+        """
+        :return: The sample of all the items added so far. If fewer than `sample_size` items were added, returns all
+                 of them.
+        :rtype: list
+        """
+        return list(self._reservoir)
+
+
 # TODO: Move to Core
 class ICRTools(object):
     @staticmethod
     def generate_sample_for_icr(data, sample_size, random_generator=None):
+        """
+        :param data: Items to sample from.
+        :type data: iterable
+        :param sample_size: Number of items to sample.
+        :type sample_size: int
+        :param random_generator: Random generator to use to draw the sample. If None, uses the `random` module.
+        :type random_generator: random.Random | None
+        :return: Random sample of `sample_size` items from `data`, or all of the `data` if it contains fewer items than
+                 `sample_size`.
+        :rtype: list
+        """
         # FIXME: Should data be de-duplicated before exporting for ICR?
 
-        if random_generator is None:
-            random_generator = random
-        if len(data) < sample_size:
-            log.warning(f"The size of the ICR data ({len(data)} items) is less than the requested sample_size "
-                        f"({sample_size} items). Returning all the input data as ICR.")
-            sample_size = len(data)
+        sampler = ReservoirSampler(sample_size, random_generator)
+        for item in data:
+            sampler.add(item)
 
-        return random_generator.sample(data, sample_size)
+        if sampler.items_seen < sample_size:
+            log.warning(f"The size of the ICR data ({sampler.items_seen} items) is less than the requested sample_size "
+                        f"({sample_size} items). Returning all the input data as ICR.")
+        return sampler.get_sample()
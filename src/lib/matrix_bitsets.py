@@ -0,0 +1,73 @@
+from collections import OrderedDict
+
+from core_data_modules.cleaners import Codes
+
+
+class MatrixBitsets(object):
+    """
+    Represents the matrix columns of a multi-coded coding configuration as a single integer bitset, in which bit i is
+    set if the code at position i in the code scheme has been assigned.
+
+    This lets the matrix columns of a coding configuration be held as one integer rather than one string per code,
+    and be folded with a bitwise OR. The bitsets are expanded to matrix columns when they are written to TracedData.
+    """
+    _code_bits = dict()  # of scheme id -> (dict of code id -> bit)
+
+    @classmethod
+    def _get_code_bits(cls, code_scheme):
+        if code_scheme.scheme_id not in cls._code_bits:
+            cls._code_bits[code_scheme.scheme_id] = {code.code_id: 1 << i for i, code in enumerate(code_scheme.codes)}
+        return cls._code_bits[code_scheme.scheme_id]
+
+    @classmethod
+    def get_control_code_mask(cls, code_scheme, control_code):
+        """
+        :param code_scheme: Code scheme to get the mask in.
+        :type code_scheme: core_data_modules.data_models.CodeScheme
+        :param control_code: Control code to get the mask of.
+        :type control_code: str
+        :return: Bitset with only the bit of the given control code set, or 0 if the scheme doesn't contain the code.
+        :rtype: int
+        """
+        code_bits = cls._get_code_bits(code_scheme)
+        mask = 0
+        for code in code_scheme.codes:
+            if code.control_code == control_code:
+                mask |= code_bits[code.code_id]
+        return mask
+
+    @classmethod
+    def labels_to_bitset(cls, code_scheme, labels):
+        """
+        :param code_scheme: Code scheme the labels are in.
+        :type code_scheme: core_data_modules.data_models.CodeScheme
+        :param labels: Serialized labels to convert.
+        :type labels: iterable of dict
+        :return: Bitset with the bits of the codes of the given labels set.
+        :rtype: int
+        """
+        code_bits = cls._get_code_bits(code_scheme)
+        bitset = 0
+        for label in labels:
+            bitset |= code_bits[label["CodeID"]]
+        return bitset
+
+    @classmethod
+    def expand(cls, cc, bitset):
+        """
+        :param cc: Multi-coded coding configuration the bitset is for.
+        :type cc: src.lib.pipeline_configuration.CodingConfiguration
+        :param bitset: Bitset to expand.
+        :type bitset: int
+        :return: Dictionary of matrix column -> Codes.MATRIX_1 or Codes.MATRIX_0, for each code in the code scheme.
+        :rtype: OrderedDict of str -> str
+        """
+        code_bits = cls._get_code_bits(cc.code_scheme)
+        matrix = OrderedDict()
+        for code in cc.code_scheme.codes:
+            key = f"{cc.analysis_file_key}{code.string_value}"
+            if bitset & code_bits[code.code_id]:
+                matrix[key] = Codes.MATRIX_1
+            elif key not in matrix:
+                matrix[key] = Codes.MATRIX_0
+        return matrix
@@ -0,0 +1,80 @@
+from collections import OrderedDict
+
+from core_data_modules.logging import Logger
+
+log = Logger(__name__)
+
+
+class _CleanerCache(object):
+    def __init__(self, name, max_size):
+        self.name = name
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()  # of text -> clean value, least recently used first
+
+    def get(self, text, cleaner):
+        if text in self._results:
+            self.hits += 1
+            self._results.move_to_end(text)
+            return self._results[text]
+
+        self.misses += 1
+        clean_value = cleaner(text)
+        self.put(text, clean_value)
+        return clean_value
+
+    def put(self, text, clean_value):
+        self._results[text] = clean_value
+        self._results.move_to_end(text)
+        if len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+
+    def __len__(self):
+        return len(self._results)
+
+
+class MemoisedCleaners(object):
+    """
+    Memoises cleaners, which are pure functions of the raw text, in a bounded LRU cache per cleaner.
+
+    There is one memoised version of each cleaner per run, so a cleaner which is run by more than one coding
+    configuration (including cleaners which call other cleaners) only cleans each distinct text once.
+
+    The memoised versions are only for getting clean values. Anything which records where a value came from, such as
+    label origins, must use the original cleaner.
+    """
+    MAX_CACHED_TEXTS_PER_CLEANER = 100000
+
+    _memoised_cleaners = dict()  # of cleaner -> memoised cleaner
+    _caches = dict()  # of cleaner -> _CleanerCache
+
+    @classmethod
+    def get(cls, cleaner, name=None):
+        """
+        :param cleaner: Cleaner to get the memoised version of.
+        :type cleaner: function of str -> str
+        :param name: Name to use for this cleaner when logging hit rates. Only used the first time a cleaner is
+                     memoised. If None, uses the cleaner's qualified name.
+        :type name: str | None
+        :return: Memoised version of `cleaner`.
+        :rtype: function of str -> str
+        """
+        if cleaner not in cls._memoised_cleaners:
+            cache = _CleanerCache(name if name is not None else cleaner.__qualname__,
+                                  cls.MAX_CACHED_TEXTS_PER_CLEANER)
+
+            def memoised_cleaner(text):
+                return cache.get(text, cleaner)
+
+            cls._caches[cleaner] = cache
+            cls._memoised_cleaners[cleaner] = memoised_cleaner
+        return cls._memoised_cleaners[cleaner]
+
+    @classmethod
+    def log_hit_rates(cls):
+        for cache in cls._caches.values():
+            calls = cache.hits + cache.misses
+            hit_rate = 0 if calls == 0 else cache.hits / calls
+            log.info(f"Cleaner '{cache.name}': {cache.hits}/{calls} cache hits ({hit_rate:.1%}), "
+                     f"{len(cache)} distinct texts cached")
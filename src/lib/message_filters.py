@@ -1,3 +1,5 @@
+from collections import Counter
+
 from core_data_modules.logging import Logger
 from dateutil.parser import isoparse
 
@@ -15,7 +17,28 @@ class MessageFilters(object):
         return filtered
 
     @staticmethod
-    def filter_test_messages(messages, test_run_key="test_run"):
+    def iter_non_test_messages(messages, drop_counts, test_run_key="test_run"):
+        """
+        Lazily filters an iterable of messages for messages which aren't tagged as being test messages.
+
+        :param messages: Message objects to filter.
+        :type messages: iterable of TracedData
+        :param drop_counts: Counter to increment the "test" count of for each message dropped.
+        :type drop_counts: collections.Counter
+        :param test_run_key: Key in each TracedData of the test message tag.
+                             TracedData objects td where td.get(test_run_key) == True are dropped.
+        :type test_run_key: str
+        :return: Generator of the messages which aren't test messages.
+        :rtype: generator of TracedData
+        """
+        for td in messages:
+            if td.get(test_run_key, False):
+                drop_counts["test"] += 1
+            else:
+                yield td
+
+    @classmethod
+    def filter_test_messages(cls, messages, test_run_key="test_run"):
         """
         Filters a list of messages for messages which aren't tagged as being test messages.
         
@@ -28,13 +51,34 @@ class MessageFilters(object):
         :rtype: list of TracedData
         """
         log.debug("Filtering out test messages...")
-        filtered = [td for td in messages if not td.get(test_run_key, False)]
+        filtered = list(cls.iter_non_test_messages(messages, Counter(), test_run_key))
         log.info(f"Filtered out test messages. "
                  f"Returning {len(filtered)}/{len(messages)} messages.")
         return filtered
 
     @staticmethod
-    def filter_empty_messages(messages, message_keys):
+    def iter_non_empty_messages(messages, drop_counts, message_keys):
+        """
+        Lazily filters an iterable of messages for objects which contain an answer in at least one of the given
+        message_keys.
+
+        :param messages: Message objects to filter.
+        :type messages: iterable of TracedData
+        :param drop_counts: Counter to increment the "empty" count of for each message dropped.
+        :type drop_counts: collections.Counter
+        :param message_keys: Keys in each TracedData to search for a message.
+        :type message_keys: list of str
+        :return: Generator of the messages which contain at least one of the message_keys.
+        :rtype: generator of TracedData
+        """
+        for td in messages:
+            if any(message_key in td for message_key in message_keys):
+                yield td
+            else:
+                drop_counts["empty"] += 1
+
+    @classmethod
+    def filter_empty_messages(cls, messages, message_keys):
         """
         Filters a list of messages for objects which contain an answer in at least one of the given message_keys.
         
@@ -46,18 +90,50 @@ class MessageFilters(object):
         :rtype: list of TracedData 
         """
         log.debug("Filtering out empty message objects...")
-        filtered = []
-        for td in messages:
-            for message_key in message_keys:
-                if message_key in td:
-                    filtered.append(td)
-                    continue
+        filtered = list(cls.iter_non_empty_messages(messages, Counter(), message_keys))
         log.info(f"Filtered out empty message objects. "
                  f"Returning {len(filtered)}/{len(messages)} messages.")
         return filtered
 
     @staticmethod
-    def filter_time_range(messages, time_keys, start_time_inclusive, end_time_inclusive):
+    def iter_messages_in_time_range(messages, drop_counts, time_keys, start_time_inclusive, end_time_exclusive):
+        """
+        Lazily filters an iterable of messages for messages received within the given time range.
+
+        Validates that each message object contains exactly one of the time_keys as it goes, and parses each message's
+        timestamp once.
+
+        :param messages: Message objects to filter.
+        :type messages: iterable of TracedData
+        :param drop_counts: Counter to increment the "time_range" count of for each message dropped.
+        :type drop_counts: collections.Counter
+        :param time_keys: Keys in each TracedData object that contain the time the message was sent.
+                          Each TracedData should have exactly one match for each key.
+                          The values must be strings in ISO 8601 format.
+        :type time_keys: set of str
+        :param start_time_inclusive: Inclusive start time of the time range to keep.
+                                     Messages sent before this time will be dropped.
+        :type start_time_inclusive: datetime.datetime
+        :param end_time_exclusive: Exclusive end time of the time range to keep.
+                                   Messages sent after this time will be dropped.
+        :type end_time_exclusive: datetime.datetime
+        :return: Generator of the messages sent within the time range.
+        :rtype: generator of TracedData
+        """
+        # De-duplicate time_keys
+        assert isinstance(time_keys, set)
+
+        for td in messages:
+            matching_time_keys = [time_key for time_key in time_keys if time_key in td]
+            assert len(matching_time_keys) == 1, len(matching_time_keys)
+
+            if start_time_inclusive <= isoparse(td[matching_time_keys[0]]) < end_time_exclusive:
+                yield td
+            else:
+                drop_counts["time_range"] += 1
+
+    @classmethod
+    def filter_time_range(cls, messages, time_keys, start_time_inclusive, end_time_inclusive):
         """
         Filters a list of messages for messages received within the given time range.
 
@@ -76,28 +152,12 @@ class MessageFilters(object):
         :return: Filtered list.
         :rtype: list of TracedData
         """
-        # De-duplicate time_keys
-        assert isinstance(time_keys, set)
-
         log.debug(f"Filtering out messages sent outside the time range "
                   f"{start_time_inclusive.isoformat()} to {end_time_inclusive.isoformat()} "
                   f"for time keys {time_keys}...")
 
-        # Validate the input data to ensure that each message object only contains one of the time_keys.
-        for td in messages:
-            matching_time_keys = 0
-            for time_key in time_keys:
-                if time_key in td:
-                    matching_time_keys += 1
-            assert matching_time_keys == 1, matching_time_keys
-
-        # Perform the actual filtering
-        filtered = []
-        for td in messages:
-            for time_key in time_keys:
-                if time_key in td and start_time_inclusive <= isoparse(td[time_key]) < end_time_inclusive:
-                    filtered.append(td)
-                    break
+        filtered = list(cls.iter_messages_in_time_range(
+            messages, Counter(), time_keys, start_time_inclusive, end_time_inclusive))
 
         log.info(f"Filtered out messages sent outside the time range "
                  f"{start_time_inclusive.isoformat()} to {end_time_inclusive.isoformat()}. "
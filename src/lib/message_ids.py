@@ -0,0 +1,75 @@
+import multiprocessing
+import time
+
+from core_data_modules.logging import Logger
+from core_data_modules.traced_data import Metadata
+from core_data_modules.util import SHAUtils
+
+log = Logger(__name__)
+
+
+class MessageIdCache(object):
+    def __init__(self, processes=None, parallel_threshold=50000):
+        """
+        Cache of Coda message ids, so that the SHA of each distinct message text is computed at most once per run,
+        however many stages and id fields need it.
+
+        :param processes: Number of worker processes to compute SHAs in, when there are at least `parallel_threshold`
+                          distinct uncached texts to hash at once. If None, uses the number of CPUs.
+        :type processes: int | None
+        :param parallel_threshold: Minimum number of uncached texts for which to hash in a process pool. Below this,
+                                   the cost of sending the texts to the workers outweighs the cost of hashing them.
+        :type parallel_threshold: int
+        """
+        self.processes = processes
+        self.parallel_threshold = parallel_threshold
+        self._message_ids = dict()  # of text -> message id
+
+    def _hash_texts(self, texts):
+        texts = [text for text in set(texts) if text not in self._message_ids]
+        if len(texts) == 0:
+            return
+
+        if len(texts) >= self.parallel_threshold and self.processes != 1:
+            log.debug(f"Computing {len(texts)} message ids in a process pool...")
+            with multiprocessing.Pool(self.processes) as pool:
+                message_ids = pool.map(SHAUtils.sha_string, texts, chunksize=1000)
+        else:
+            message_ids = [SHAUtils.sha_string(text) for text in texts]
+
+        self._message_ids.update(zip(texts, message_ids))
+
+    def get_message_id(self, text):
+        """
+        :param text: Text of the message to get the Coda message id of.
+        :type text: str
+        :return: Message id, which is the SHA of the text.
+        :rtype: str
+        """
+        if text not in self._message_ids:
+            self._message_ids[text] = SHAUtils.sha_string(text)
+        return self._message_ids[text]
+
+    def set_message_ids(self, user, data, message_id_keys):
+        """
+        Appends the message id of each of the given message keys to each object in an iterable of TracedData, with
+        one append per TracedData object for all of the keys.
+
+        This is equivalent to calling TracedDataCodaV2IO.compute_message_ids for each (message key, message id key),
+        but each distinct text is only hashed once.
+
+        :param user: Identifier of the user running this program, for TracedData Metadata.
+        :type user: str
+        :param data: TracedData objects to set the message ids of.
+        :type data: list of TracedData
+        :param message_id_keys: Dictionary of (key in each TracedData of the message text) ->
+                                (key in each TracedData to write the message id to)
+        :type message_id_keys: dict of str -> str
+        """
+        self._hash_texts([td[message_key] for td in data for message_key in message_id_keys if message_key in td])
+
+        for td in data:
+            ids_dict = {message_id_key: self._message_ids[td[message_key]]
+                        for message_key, message_id_key in message_id_keys.items() if message_key in td}
+            if len(ids_dict) > 0:
+                td.append_data(ids_dict, Metadata(user, Metadata.get_call_location(), time.time()))
@@ -0,0 +1,70 @@
+from collections import OrderedDict
+
+
+class MessageIndex(object):
+    def __init__(self, data, raw_fields):
+        """
+        Inverted index of each raw field (i.e. each show or survey question) to the positions of the messages in a
+        list of TracedData which contain that field, built in a single pass over the data.
+
+        Stages which only need the messages which contain a particular raw field can query this index rather than
+        scanning every message. Positions are kept in ascending order, so the messages for a field are always returned
+        in the order they appear in `data`.
+
+        The index reflects the keys in each message when it was built, so must be rebuilt if a raw field is added to
+        or hidden from any of the messages. Stages which are passed an index built by an earlier stage must therefore
+        not add or hide raw fields, and should check with MessageIndex.assert_indexes that the index is of the list
+        of messages they were given.
+
+        :param data: Messages to index. The list must not be reordered, added to, or removed from while the index is in
+                     use.
+        :type data: list of TracedData
+        :param raw_fields: Raw fields to index.
+        :type raw_fields: iterable of str
+        """
+        self.data = data
+        self._data_length = len(data)
+        self._positions = OrderedDict((raw_field, []) for raw_field in raw_fields)  # of raw field -> list of int
+
+        for i, td in enumerate(data):
+            for raw_field, positions in self._positions.items():
+                if raw_field in td:
+                    positions.append(i)
+
+    @classmethod
+    def for_coding_plans(cls, data, coding_plans):
+        """
+        :param data: Messages to index.
+        :type data: list of TracedData
+        :param coding_plans: Coding plans whose raw fields to index.
+        :type coding_plans: iterable of src.lib.pipeline_configuration.CodingPlan
+        :return: Index of the raw fields of the given coding plans.
+        :rtype: MessageIndex
+        """
+        return cls(data, OrderedDict.fromkeys(plan.raw_field for plan in coding_plans))
+
+    def get_messages(self, raw_field):
+        """
+        :param raw_field: Raw field to look up.
+        :type raw_field: str
+        :return: Messages which contain `raw_field`, in the order they appear in `data`.
+        :rtype: list of TracedData
+        """
+        data = self.data
+        return [data[i] for i in self._positions[raw_field]]
+
+    def assert_indexes(self, data):
+        """
+        Asserts that this index was built from the given list of messages, and that no messages have been added to or
+        removed from that list since.
+
+        Whether a raw field has been added to or hidden from any of the messages since the index was built can't be
+        checked without rebuilding the index, so that is left to the stages sharing it (see MessageIndex).
+
+        :param data: Messages which this index is expected to be of.
+        :type data: list of TracedData
+        """
+        assert data is self.data, "The MessageIndex was built from a different list of messages"
+        assert len(data) == self._data_length, \
+            f"Messages were added to or removed from the list of {self._data_length} messages the MessageIndex was " \
+            f"built from, which now contains {len(data)} messages"
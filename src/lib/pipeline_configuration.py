@@ -1,6 +1,8 @@
 import json
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 from datetime import datetime
+from types import MappingProxyType
 from urllib.parse import urlparse
 
 import pytz
@@ -8,7 +10,9 @@ from core_data_modules.cleaners import Codes, swahili, somali
 from core_data_modules.data_models import validators
 from dateutil.parser import isoparse
 
-from src.lib import CodeSchemes, code_imputation_functions
+from src.lib import code_imputation_functions
+from src.lib.code_schemes import CodeSchemes
+from src.lib.memoised_cleaners import MemoisedCleaners
 
 
 class CodingModes(object):
@@ -80,6 +84,135 @@ class CodingPlan(object):
         self.id_field = id_field
 
 
+class PlanRegistry(object):
+    def __init__(self, rqa_coding_plans, survey_coding_plans):
+        """
+        Read-only registry of the coding plans of a project, with the lookups and key lists which the pipeline stages
+        derive from the plans precomputed once, so that stages don't need to search or concatenate the plan lists,
+        or rebuild the key lists, themselves.
+
+        :param rqa_coding_plans: Coding plans of the RQA datasets.
+        :type rqa_coding_plans: iterable of CodingPlan
+        :param survey_coding_plans: Coding plans of the survey datasets.
+        :type survey_coding_plans: iterable of CodingPlan
+        """
+        self.rqa_plans = tuple(rqa_coding_plans)
+        self.survey_plans = tuple(survey_coding_plans)
+        self.all_plans = self.rqa_plans + self.survey_plans
+        self.coda_plans = tuple(plan for plan in self.all_plans if plan.coda_filename is not None)
+
+        self.rqa_raw_fields = tuple(OrderedDict.fromkeys(plan.raw_field for plan in self.rqa_plans))
+        self.survey_raw_fields = tuple(OrderedDict.fromkeys(plan.raw_field for plan in self.survey_plans))
+        self.rqa_time_fields = tuple(OrderedDict.fromkeys(plan.time_field for plan in self.rqa_plans))
+
+        # Lookups. Where more than one plan has the same key, the first plan in all_plans is used.
+        plans_by_raw_field = dict()
+        plans_by_coda_filename = dict()
+        plans_by_ws_code_id = dict()
+        coding_configurations_by_coded_field = dict()
+        for plan in self.all_plans:
+            plans_by_raw_field.setdefault(plan.raw_field, plan)
+            if plan.coda_filename is not None:
+                plans_by_coda_filename.setdefault(plan.coda_filename, plan)
+            if plan.ws_code is not None:
+                plans_by_ws_code_id.setdefault(plan.ws_code.code_id, plan)
+            for cc in plan.coding_configurations:
+                coding_configurations_by_coded_field.setdefault(cc.coded_field, (plan, cc))
+        self._plans_by_raw_field = MappingProxyType(plans_by_raw_field)
+        self._plans_by_coda_filename = MappingProxyType(plans_by_coda_filename)
+        self._plans_by_ws_code_id = MappingProxyType(plans_by_ws_code_id)
+        self._coding_configurations_by_coded_field = MappingProxyType(coding_configurations_by_coded_field)
+
+        # Production file keys
+        self.production_keys = ("uid",) + tuple(
+            OrderedDict.fromkeys(plan.raw_field for plan in self.rqa_plans + self.survey_plans))
+
+        # Analysis file keys, in export order, and how they are to be handled when folding.
+        analysis_configurations = []  # of (plan, cc), for the coding configurations which have an analysis_file_key
+        export_keys = []
+        equal_keys = []
+        concat_keys = []
+        binary_keys = []
+        for plan in self.all_plans:
+            for cc in plan.coding_configurations:
+                if cc.analysis_file_key is None:
+                    continue
+                analysis_configurations.append((plan, cc))
+
+                if cc.coding_mode == CodingModes.SINGLE:
+                    export_keys.append(cc.analysis_file_key)
+
+                    if cc.folding_mode == FoldingModes.ASSERT_EQUAL:
+                        equal_keys.append(cc.analysis_file_key)
+                    elif cc.folding_mode == FoldingModes.YES_NO_AMB:
+                        binary_keys.append(cc.analysis_file_key)
+                    else:
+                        assert False, f"Incompatible folding_mode {cc.folding_mode}"
+                else:
+                    assert cc.folding_mode == FoldingModes.MATRIX
+                    for code in cc.code_scheme.codes:
+                        export_keys.append(f"{cc.analysis_file_key}{code.string_value}")
+
+            export_keys.append(plan.raw_field)
+            if plan.raw_field_folding_mode == FoldingModes.CONCATENATE:
+                concat_keys.append(plan.raw_field)
+            elif plan.raw_field_folding_mode == FoldingModes.ASSERT_EQUAL:
+                equal_keys.append(plan.raw_field)
+            else:
+                assert False, f"Incompatible raw_field_folding_mode {plan.raw_field_folding_mode}"
+
+        self.analysis_configurations = tuple(analysis_configurations)
+        self.multi_coded_analysis_configurations = tuple(
+            (plan, cc) for plan, cc in analysis_configurations if cc.coding_mode == CodingModes.MULTIPLE)
+        self.analysis_export_keys = tuple(export_keys)
+        self.analysis_equal_keys = tuple(equal_keys)
+        self.analysis_concat_keys = tuple(concat_keys)
+        self.analysis_binary_keys = tuple(binary_keys)
+
+        self._frozen = True
+
+    def get_plan_by_raw_field(self, raw_field):
+        """
+        :param raw_field: Raw field to look up.
+        :type raw_field: str
+        :return: The coding plan with the given raw field, or None if there isn't one.
+        :rtype: CodingPlan | None
+        """
+        return self._plans_by_raw_field.get(raw_field)
+
+    def get_plan_by_coda_filename(self, coda_filename):
+        """
+        :param coda_filename: Coda filename to look up.
+        :type coda_filename: str
+        :return: The coding plan with the given Coda filename, or None if there isn't one.
+        :rtype: CodingPlan | None
+        """
+        return self._plans_by_coda_filename.get(coda_filename)
+
+    def get_plan_by_ws_code_id(self, ws_code_id):
+        """
+        :param ws_code_id: Id of a code in the 'WS - Correct Dataset' code scheme.
+        :type ws_code_id: str
+        :return: The coding plan whose ws_code has the given id, or None if there isn't one.
+        :rtype: CodingPlan | None
+        """
+        return self._plans_by_ws_code_id.get(ws_code_id)
+
+    def get_coding_configuration_by_coded_field(self, coded_field):
+        """
+        :param coded_field: Coded field to look up.
+        :type coded_field: str
+        :return: The coding plan and coding configuration with the given coded field, or None if there isn't one.
+        :rtype: (CodingPlan, CodingConfiguration) | None
+        """
+        return self._coding_configurations_by_coded_field.get(coded_field)
+
+    def __setattr__(self, key, value):
+        if getattr(self, "_frozen", False):
+            raise AttributeError(f"Can't set attribute '{key}' of a PlanRegistry, because it is read-only")
+        super().__setattr__(key, value)
+
+
 class PipelineConfiguration(object):
     RQA_CODING_PLANS = [
         CodingPlan(raw_field="rqa_s05e01_raw",
@@ -115,7 +248,9 @@ class PipelineConfiguration(object):
 
     @staticmethod
     def clean_district_if_no_mogadishu_sub_district(text):
-        mogadishu_sub_district = somali.DemographicCleaner.clean_mogadishu_sub_district(text)
+        # Use the memoised Mogadishu sub-district cleaner, so that the result already computed for the
+        # mogadishu_sub_district_coded coding configuration is re-used.
+        mogadishu_sub_district = MemoisedCleaners.get(somali.DemographicCleaner.clean_mogadishu_sub_district)(text)
         if mogadishu_sub_district == Codes.NOT_CODED:
             return somali.DemographicCleaner.clean_somalia_district(text)
         else:
@@ -292,6 +427,8 @@ class PipelineConfiguration(object):
                    raw_field_folding_mode=FoldingModes.ASSERT_EQUAL)
     ]
 
+    PLAN_REGISTRY = PlanRegistry(RQA_CODING_PLANS, SURVEY_CODING_PLANS)
+
     def __init__(self, raw_data_sources, phone_number_uuid_table, timestamp_remappings,
                  rapid_pro_key_remappings, project_start_date, project_end_date, filter_test_messages, move_ws_messages,
                  memory_profile_upload_url_prefix, data_archive_upload_url_prefix, drive_upload=None):
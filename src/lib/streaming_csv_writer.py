@@ -0,0 +1,65 @@
+import csv
+import io
+
+
+class StreamingCSVWriter(object):
+    DEFAULT_CHUNK_SIZE = 1000
+
+    def __init__(self, f, headers, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Writes TracedData to a CSV file, projecting only the given headers from each TracedData and writing the rows
+        in buffered chunks.
+
+        The output is the same as that of TracedDataCSVIO.export_traced_data_iterable_to_csv when given the same
+        headers: a header row, then one row per TracedData, in which missing and None values are empty.
+
+        Any mapping with a `get` method may be written in place of a TracedData.
+
+        :param f: File to write the CSV to.
+        :type f: file-like
+        :param headers: Keys to write, in column order.
+        :type headers: list of str
+        :param chunk_size: Number of rows to buffer before writing them to `f`.
+        :type chunk_size: int
+        """
+        self.f = f
+        self.headers = list(headers)
+        self.chunk_size = chunk_size
+
+    def _write_chunk(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        self.f.write(buffer.getvalue())
+
+    def write(self, data):
+        """
+        Writes the header row, then a row for each item in `data`.
+
+        :param data: TracedData objects to write.
+        :type data: iterable of (TracedData | collections.abc.Mapping)
+        """
+        headers = self.headers
+        rows = [headers]
+        for td in data:
+            get = td.get
+            rows.append([get(key) for key in headers])
+            if len(rows) >= self.chunk_size:
+                self._write_chunk(rows)
+                rows = []
+        self._write_chunk(rows)
+
+    @classmethod
+    def export_to_csv(cls, data, f, headers, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Writes TracedData to a CSV file. See StreamingCSVWriter.__init__.
+
+        :param data: TracedData objects to write.
+        :type data: iterable of (TracedData | collections.abc.Mapping)
+        :param f: File to write the CSV to.
+        :type f: file-like
+        :param headers: Keys to write, in column order.
+        :type headers: list of str
+        :param chunk_size: Number of rows to buffer before writing them to `f`.
+        :type chunk_size: int
+        """
+        cls(f, headers, chunk_size).write(data)
@@ -0,0 +1,69 @@
+from core_data_modules.logging import Logger
+from core_data_modules.traced_data.io import TracedDataJsonIO
+
+from src.combine_raw_datasets import CombineRawDatasets
+from src.translate_rapid_pro_keys import TranslateRapidProKeys
+
+log = Logger(__name__)
+
+
+class LoadRawData(object):
+    @staticmethod
+    def load_datasets(raw_data_dir, flow_names):
+        """
+        Loads the TracedData of each of the given flows from the raw data files exported by fetch_raw_data.py.
+
+        :param raw_data_dir: Directory containing the raw data files.
+        :type raw_data_dir: str
+        :param flow_names: Names of the flows to load.
+        :type flow_names: list of str
+        :return: The runs of each flow, in the order of `flow_names`.
+        :rtype: list of list of TracedData
+        """
+        datasets = []
+        for i, flow_name in enumerate(flow_names):
+            raw_flow_path = f"{raw_data_dir}/{flow_name}.jsonl"
+            log.info(f"Loading {i + 1}/{len(flow_names)}: {raw_flow_path}...")
+            with open(raw_flow_path, "r") as f:
+                runs = TracedDataJsonIO.import_jsonl_to_traced_data_iterable(f)
+            log.info(f"Loaded {len(runs)} runs")
+            datasets.append(runs)
+        return datasets
+
+    @classmethod
+    def load_messages(cls, user, raw_data_dir, pipeline_configuration):
+        """
+        Loads the activation and survey datasets of every raw data source, adds the survey responses of each
+        participant to their messages, and translates the Rapid Pro keys of the result.
+
+        :param user: Identifier of the user running this program, for TracedData Metadata.
+        :type user: str
+        :param raw_data_dir: Directory containing the raw data files exported by fetch_raw_data.py.
+        :type raw_data_dir: str
+        :param pipeline_configuration: Pipeline configuration, which lists the flows to load.
+        :type pipeline_configuration: src.lib.PipelineConfiguration
+        :return: The messages, with the survey responses of the participants who sent them.
+        :rtype: list of TracedData
+        """
+        activation_flow_names = []
+        survey_flow_names = []
+        for raw_data_source in pipeline_configuration.raw_data_sources:
+            activation_flow_names.extend(raw_data_source.get_activation_flow_names())
+            survey_flow_names.extend(raw_data_source.get_survey_flow_names())
+
+        log.info("Loading activation datasets...")
+        activation_datasets = cls.load_datasets(raw_data_dir, activation_flow_names)
+
+        log.info("Loading survey datasets...")
+        survey_datasets = cls.load_datasets(raw_data_dir, survey_flow_names)
+
+        # Add survey data to the messages
+        log.info("Combining Datasets...")
+        coalesced_survey_datasets = []
+        for dataset in survey_datasets:
+            coalesced_survey_datasets.append(
+                CombineRawDatasets.coalesce_traced_runs_by_key(user, dataset, "avf_phone_id"))
+        data = CombineRawDatasets.combine_raw_datasets(user, activation_datasets, coalesced_survey_datasets)
+
+        log.info("Translating Rapid Pro Keys...")
+        return TranslateRapidProKeys.translate_rapid_pro_keys(user, data, pipeline_configuration)
@@ -1,4 +1,5 @@
-from datetime import datetime
+from bisect import bisect_right
+from datetime import datetime, timedelta
 
 import pytz
 from core_data_modules.logging import Logger
@@ -10,6 +11,56 @@ from src.lib import PipelineConfiguration
 
 log = Logger(__name__)
 
+_EPOCH = pytz.utc.localize(datetime(1970, 1, 1))
+
+
+def _to_epoch_micros(dt):
+    """
+    Converts a timezone-aware datetime to an integer number of microseconds since the Unix epoch.
+    Integers are used rather than float timestamps so that comparisons are exact to the microsecond.
+    """
+    return (dt - _EPOCH) // timedelta(microseconds=1)
+
+
+class _TimestampRemappingIndex(object):
+    """
+    Sorted interval index over the time ranges of the timestamp remappings which share a time key.
+
+    The range boundaries split the time line into elementary intervals. Each elementary interval stores the
+    (configuration-order) indices of the remappings whose range covers it, so finding the remappings that apply to
+    a timestamp is one bisect over the boundaries.
+    """
+    def __init__(self):
+        self._ranges = []  # of (remapping index, start epoch micros, end epoch micros)
+        self._boundaries = []
+        self._covering = []  # of list of remapping index, for each elementary interval
+
+    def add(self, remapping_index, range_start_inclusive, range_end_exclusive):
+        self._ranges.append(
+            (remapping_index, _to_epoch_micros(range_start_inclusive), _to_epoch_micros(range_end_exclusive)))
+
+    def build(self):
+        self._boundaries = sorted({b for _, start, end in self._ranges for b in (start, end)})
+        self._covering = []
+        for lower, upper in zip(self._boundaries, self._boundaries[1:]):
+            self._covering.append(sorted(
+                remapping_index for remapping_index, start, end in self._ranges if start <= lower and upper <= end
+            ))
+
+    def first_match_after(self, epoch_micros, remapping_index):
+        """
+        :return: The smallest index of a remapping whose range contains `epoch_micros` and which is greater than
+                 `remapping_index`, or None if there is no such remapping.
+        :rtype: int | None
+        """
+        interval = bisect_right(self._boundaries, epoch_micros) - 1
+        if interval < 0 or interval >= len(self._covering):
+            return None
+
+        covering = self._covering[interval]
+        i = bisect_right(covering, remapping_index)
+        return covering[i] if i < len(covering) else None
+
 
 class TranslateRapidProKeys(object):
     @classmethod
@@ -39,75 +90,80 @@ class TranslateRapidProKeys(object):
 
             td.append_data(show_dict, Metadata(user, Metadata.get_call_location(), TimeUtils.utc_now_as_iso_string()))
 
-    @classmethod
-    def _remap_radio_show_by_time_range(cls, user, data, time_key, show_pipeline_key_to_remap_to,
-                                        range_start=None, range_end=None, time_to_adjust_to=None):
-        """
-        Remaps radio show messages received in the given time range to another radio show.
-
-        Optionally adjusts the datetime of re-mapped messages to a constant.
-
-        :param user: Identifier of the user running this program, for TracedData Metadata.
-        :type user: str
-        :param data: TracedData objects to set the show ids of.
-        :type data: iterable of TracedData
-        :param time_key: Key in each TracedData of an ISO 8601-formatted datetime string to read the message sent on
-                         time from.
-        :type time_key: str
-        :param show_pipeline_key_to_remap_to: Pipeline key to assign to messages received within the given time range.
-        :type show_pipeline_key_to_remap_to: str
-        :param range_start: Start datetime for the time range to remap radio show messages from, inclusive.
-                            If None, defaults to the beginning of time.
-        :type range_start: datetime | None
-        :param range_end: End datetime for the time range to remap radio show messages from, exclusive.
-                          If None, defaults to the end of time.
-        :type range_end: datetime | None
-        :param time_to_adjust_to: Datetime to assign to the `time_key` field of re-mapped shows.
-                                  If None, re-mapped shows will not have timestamps re-adjusted.
-        :type time_to_adjust_to: datetime | None
-        """
-        if range_start is None:
-            range_start = pytz.utc.localize(datetime.min)
-        if range_end is None:
-            range_end = pytz.utc.localize(datetime.max)
-
-        log.info(f"Remapping messages in time range {range_start.isoformat()} to {range_end.isoformat()} "
-                 f"to show {show_pipeline_key_to_remap_to}...")
-
-        remapped_count = 0
-        for td in data:
-            if time_key in td and range_start <= isoparse(td[time_key]) < range_end:
-                remapped_count += 1
-
-                remapped = {
-                    "show_pipeline_key": show_pipeline_key_to_remap_to
-                }
-                if time_to_adjust_to is not None:
-                    remapped[time_key] = time_to_adjust_to.isoformat()
-
-                td.append_data(remapped,
-                               Metadata(user, Metadata.get_call_location(), TimeUtils.utc_now_as_iso_string()))
-
-        log.info(f"Remapped {remapped_count} messages to show {show_pipeline_key_to_remap_to}")
-
     @classmethod
     def remap_radio_shows(cls, user, data, pipeline_configuration):
         """
         Remaps radio shows which were in the wrong flow, and therefore have the wrong key/values set, to have the
         key/values they would have had if they had been received by the correct flow.
 
+        Each message's time keys are parsed once, and the remappings which apply to each message are resolved through
+        a _TimestampRemappingIndex rather than by re-scanning the data once per remapping. The result is the same as
+        applying each of the timestamp remappings to all of the data, in the order they are given in the configuration.
+
         :param user: Identifier of the user running this program, for TracedData Metadata.
         :type user: str
         :param data: TracedData objects to move the radio show messages in.
-        :type data: iterable of TracedData
+        :type data: list of TracedData
         :param pipeline_configuration: Pipeline configuration.
         :type pipeline_configuration: PipelineConfiguration
         """
-        for remapping in pipeline_configuration.timestamp_remappings:
-            cls._remap_radio_show_by_time_range(
-                user, data, remapping.time_key, remapping.show_pipeline_key_to_remap_to,
-                remapping.range_start_inclusive, remapping.range_end_exclusive, remapping.time_to_adjust_to
-            )
+        remappings = pipeline_configuration.timestamp_remappings
+        if len(remappings) == 0:
+            return
+
+        for remapping in remappings:
+            log.info(f"Remapping messages in time range {remapping.range_start_inclusive.isoformat()} to "
+                     f"{remapping.range_end_exclusive.isoformat()} to show {remapping.show_pipeline_key_to_remap_to}...")
+
+        indices = dict()  # of time_key -> _TimestampRemappingIndex
+        for i, remapping in enumerate(remappings):
+            if remapping.time_key not in indices:
+                indices[remapping.time_key] = _TimestampRemappingIndex()
+            indices[remapping.time_key].add(i, remapping.range_start_inclusive, remapping.range_end_exclusive)
+        for index in indices.values():
+            index.build()
+
+        # Parse each message's time keys exactly once, into a column of epoch microseconds per time key.
+        time_columns = dict()  # of time_key -> list of (int | None)
+        for time_key in indices.keys():
+            time_columns[time_key] = [_to_epoch_micros(isoparse(td[time_key])) if time_key in td else None
+                                      for td in data]
+
+        remapped_counts = [0] * len(remappings)
+        for position, td in enumerate(data):
+            times = {time_key: column[position] for time_key, column in time_columns.items()
+                     if column[position] is not None}
+            if len(times) == 0:
+                continue
+
+            # Replay the remappings in configuration order. Applying a remapping which adjusts the timestamp can
+            # change which of the later remappings apply, so after each match search again for the earliest
+            # remapping after the one just applied.
+            remapped = dict()
+            last_applied = -1
+            while True:
+                next_remapping = None
+                for time_key, epoch_micros in times.items():
+                    candidate = indices[time_key].first_match_after(epoch_micros, last_applied)
+                    if candidate is not None and (next_remapping is None or candidate < next_remapping):
+                        next_remapping = candidate
+                if next_remapping is None:
+                    break
+
+                remapping = remappings[next_remapping]
+                remapped_counts[next_remapping] += 1
+                remapped["show_pipeline_key"] = remapping.show_pipeline_key_to_remap_to
+                if remapping.time_to_adjust_to is not None:
+                    remapped[remapping.time_key] = remapping.time_to_adjust_to.isoformat()
+                    times[remapping.time_key] = _to_epoch_micros(remapping.time_to_adjust_to)
+                last_applied = next_remapping
+
+            if len(remapped) > 0:
+                td.append_data(remapped,
+                               Metadata(user, Metadata.get_call_location(), TimeUtils.utc_now_as_iso_string()))
+
+        for remapping, remapped_count in zip(remappings, remapped_counts):
+            log.info(f"Remapped {remapped_count} messages to show {remapping.show_pipeline_key_to_remap_to}")
 
     @classmethod
     def remap_key_names(cls, user, data, pipeline_configuration):
@@ -181,7 +237,7 @@ class TranslateRapidProKeys(object):
         """
         for td in data:
             null_keys = set()
-            for plan in PipelineConfiguration.RQA_CODING_PLANS + PipelineConfiguration.SURVEY_CODING_PLANS:
+            for plan in PipelineConfiguration.PLAN_REGISTRY.all_plans:
                 if plan.raw_field in td and td[plan.raw_field] is None:
                     null_keys.update({plan.raw_field, plan.time_field})
             td.hide_keys(null_keys, Metadata(user, Metadata.get_call_location(), TimeUtils.utc_now_as_iso_string()))
@@ -1,12 +1,12 @@
+import multiprocessing
 import time
+from collections import Counter, defaultdict
 
 from core_data_modules.cleaners import Codes
-from core_data_modules.cleaners.cleaning_utils import CleaningUtils
 from core_data_modules.logging import Logger
-from core_data_modules.traced_data import Metadata
-from core_data_modules.traced_data.io import TracedDataCodaV2IO
+from core_data_modules.traced_data import Metadata, TracedData
 
-from src.lib import PipelineConfiguration
+from src.lib import PipelineConfiguration, ControlCodeLabels
 from src.lib.pipeline_configuration import CodeSchemes, CodingModes
 
 log = Logger(__name__)
@@ -19,39 +19,96 @@ class _WSUpdate(object):
         self.source = source
 
 
+class _WSCorrectionPlanTables(object):
+    def __init__(self):
+        """
+        Lookup tables over the coding plans and the 'WS - Correct Dataset' code scheme, built once per run so that
+        the correction of each uid group does not need to search or rebuild them.
+        """
+        plan_registry = PipelineConfiguration.PLAN_REGISTRY
+        self.survey_plans = plan_registry.survey_plans
+        self.survey_coda_plans = [plan for plan in self.survey_plans if plan.coda_filename is not None]
+        self.rqa_coda_plans = [plan for plan in plan_registry.rqa_plans if plan.coda_filename is not None]
+
+        self.raw_survey_fields = set(plan_registry.survey_raw_fields)
+        self.raw_rqa_fields = set(plan_registry.rqa_raw_fields)
+        self.rqa_time_fields = set(plan_registry.rqa_time_fields)
+
+        self.raw_field_to_rqa_plan = {plan.raw_field: plan for plan in plan_registry.rqa_plans}
+
+        # Map from the id of each 'WS - Correct Dataset' code which requests a move to the raw field that code
+        # indicates a move to, or to None if no coding plan in this project has that code.
+        # Codes which do not request a move are not in this map.
+        self.ws_code_id_to_target = dict()
+        self.ws_code_id_to_display_key = dict()
+        for code in CodeSchemes.WS_CORRECT_DATASET.codes:
+            if code.code_type == "Normal" or code.control_code == Codes.NOT_CODED:
+                target_plan = plan_registry.get_plan_by_ws_code_id(code.code_id)
+                self.ws_code_id_to_target[code.code_id] = None if target_plan is None else target_plan.raw_field
+                self.ws_code_id_to_display_key[code.code_id] = (code.code_id, code.display_text)
+
+
+_worker_plan_tables = None
+
+
+def _init_ws_correction_worker():
+    # The plan tables reference the cleaner functions, some of which are lambdas that can't be pickled, so each worker
+    # builds its own copy instead of receiving it from the parent process.
+    global _worker_plan_tables
+    _worker_plan_tables = _WSCorrectionPlanTables()
+
+
+def _correct_uid_group_chunk(args):
+    user, groups = args
+    corrected_data = []
+    unknown_target_code_counts = Counter()
+    for group in groups:
+        corrected_data.extend(
+            WSCorrection._correct_uid_group(user, group, _worker_plan_tables, unknown_target_code_counts))
+    return corrected_data, unknown_target_code_counts
+
+
 class WSCorrection(object):
     @staticmethod
-    def move_wrong_scheme_messages(user, data, coda_input_dir):
-        log.info("Importing manually coded Coda files to '_WS' fields...")
-        for plan in PipelineConfiguration.RQA_CODING_PLANS + PipelineConfiguration.SURVEY_CODING_PLANS:
-            if plan.coda_filename is None:
-                continue
+    def move_wrong_scheme_messages(user, data, coda_datasets, message_id_cache, processes=1,
+                                   uid_groups_per_chunk=1000):
+        """
+        Moves messages labelled as Wrong Scheme in Coda to the dataset they were labelled as belonging to.
+
+        The correction of each uid is independent of all the others, so can optionally be run in a pool of worker
+        processes. The uid groups are sent to the workers in chunks, and the corrected data is returned in the same
+        order as when run serially.
+
+        :param user: Identifier of the user running this program, for TracedData Metadata.
+        :type user: str
+        :param data: TracedData objects to move the WS messages in.
+        :type data: list of TracedData
+        :param coda_datasets: Coda files generated by a previous run of this pipeline, to read the WS labels from.
+        :type coda_datasets: src.lib.CodaDatasets
+        :param message_id_cache: Cache of message ids to compute the '_WS' message ids with.
+        :type message_id_cache: src.lib.MessageIdCache
+        :param processes: Number of worker processes to correct the uid groups with. If 1, runs in this process.
+        :type processes: int
+        :param uid_groups_per_chunk: Number of uid groups to send to a worker process at a time, when processes > 1.
+        :type uid_groups_per_chunk: int
+        :return: TracedData objects with the WS messages moved.
+        :rtype: list of TracedData
+        """
+        assert processes >= 1, f"processes must be at least 1, but was {processes}"
 
-            TracedDataCodaV2IO.compute_message_ids(user, data, plan.raw_field, f"{plan.id_field}_WS")
-            with open(f"{coda_input_dir}/{plan.coda_filename}") as f:
-                TracedDataCodaV2IO.import_coda_2_to_traced_data_iterable(
-                    user, data, f"{plan.id_field}_WS",
-                    {f"{plan.raw_field}_WS_correct_dataset": CodeSchemes.WS_CORRECT_DATASET}, f
-                )
+        log.info("Importing manually coded Coda files to '_WS' fields...")
+        message_id_cache.set_message_ids(user, data, {
+            plan.raw_field: f"{plan.id_field}_WS" for plan in PipelineConfiguration.PLAN_REGISTRY.coda_plans
+        })
 
-            for cc in plan.coding_configurations:
-                with open(f"{coda_input_dir}/{plan.coda_filename}") as f:
-                    if cc.coding_mode == CodingModes.SINGLE:
-                        TracedDataCodaV2IO.import_coda_2_to_traced_data_iterable(
-                            user, data, plan.id_field + "_WS",
-                            {f"{cc.coded_field}_WS": cc.code_scheme}, f
-                        )
-                    else:
-                        assert cc.coding_mode == CodingModes.MULTIPLE
-                        TracedDataCodaV2IO.import_coda_2_to_traced_data_iterable_multi_coded(
-                            user, data, f"{plan.id_field}_WS",
-                            {f"{cc.coded_field}_WS": cc.code_scheme}, f
-                        )
+        for plan in PipelineConfiguration.PLAN_REGISTRY.coda_plans:
+            coda_datasets.import_plan_labels_to_traced_data_iterable(user, data, plan.coda_filename, key_suffix="_WS")
 
         log.info("Checking for WS Coding Errors...")
         # Check for coding errors
+        control_code_labels = ControlCodeLabels(Metadata.get_call_location())
         for td in data:
-            for plan in PipelineConfiguration.RQA_CODING_PLANS + PipelineConfiguration.SURVEY_CODING_PLANS:
+            for plan in PipelineConfiguration.PLAN_REGISTRY.all_plans:
                 rqa_codes = []
                 for cc in plan.coding_configurations:
                     if cc.coding_mode == CodingModes.SINGLE:
@@ -78,172 +135,38 @@ class WSCorrection(object):
                     log.warning(f"Coding Error: {plan.raw_field}: {td[plan.raw_field]}")
                     coding_error_dict = {
                         f"{plan.raw_field}_WS_correct_dataset":
-                            CleaningUtils.make_label_from_cleaner_code(
-                                CodeSchemes.WS_CORRECT_DATASET,
-                                CodeSchemes.WS_CORRECT_DATASET.get_code_with_control_code(Codes.CODING_ERROR),
-                                Metadata.get_call_location(),
-                            ).to_dict()
+                            control_code_labels.get_label(CodeSchemes.WS_CORRECT_DATASET, Codes.CODING_ERROR)
                     }
                     td.append_data(coding_error_dict, Metadata(user, Metadata.get_call_location(), time.time()))
 
-        # Construct a map from WS normal code id to the raw field that code indicates a requested move to.
-        ws_code_to_raw_field_map = dict()
-        for plan in PipelineConfiguration.RQA_CODING_PLANS + PipelineConfiguration.SURVEY_CODING_PLANS:
-            if plan.ws_code is not None:
-                ws_code_to_raw_field_map[plan.ws_code.code_id] = plan.raw_field
+        plan_tables = _WSCorrectionPlanTables()
 
         # Group the TracedData by uid.
-        data_grouped_by_uid = dict()
+        data_grouped_by_uid = defaultdict(list)
         for td in data:
-            uid = td["uid"]
-            if uid not in data_grouped_by_uid:
-                data_grouped_by_uid[uid] = []
-            data_grouped_by_uid[uid].append(td)
+            data_grouped_by_uid[td["uid"]].append(td)
 
         # Perform the WS correction for each uid.
-        log.info("Performing WS correction...")
         corrected_data = []  # List of TracedData with the WS data moved.
-        unknown_target_code_counts = dict()  # 'WS - Correct Dataset' codes with no matching code id in any coding plan
-                                             # for this project, with a count of the occurrences
-        for group in data_grouped_by_uid.values():
-            # Find all the surveys data being moved.
-            # (Note: we only need to check one td in this group because all the demographics are the same)
-            td = group[0]
-            survey_moves = dict()  # of source_field -> target_field
-            for plan in PipelineConfiguration.SURVEY_CODING_PLANS:
-                if plan.raw_field not in td or plan.coda_filename is None:
-                    continue
-                ws_code = CodeSchemes.WS_CORRECT_DATASET.get_code_with_code_id(td[f"{plan.raw_field}_WS_correct_dataset"]["CodeID"])
-                if ws_code.code_type == "Normal" or ws_code.control_code == Codes.NOT_CODED:
-                    if ws_code.code_id in ws_code_to_raw_field_map:
-                        survey_moves[plan.raw_field] = ws_code_to_raw_field_map[ws_code.code_id]
-                    else:
-                        if (ws_code.code_id, ws_code.display_text) not in unknown_target_code_counts:
-                            unknown_target_code_counts[(ws_code.code_id, ws_code.display_text)] = 0
-                        unknown_target_code_counts[(ws_code.code_id, ws_code.display_text)] += 1
-                        survey_moves[plan.raw_field] = None
-
-            # Find all the RQA data being moved.
-            rqa_moves = dict()  # of (index in group, source_field) -> target_field
-            for i, td in enumerate(group):
-                for plan in PipelineConfiguration.RQA_CODING_PLANS:
-                    if plan.raw_field not in td or plan.coda_filename is None:
-                        continue
-                    ws_code = CodeSchemes.WS_CORRECT_DATASET.get_code_with_code_id(td[f"{plan.raw_field}_WS_correct_dataset"]["CodeID"])
-                    if ws_code.code_type == "Normal" or ws_code.control_code == Codes.NOT_CODED:
-                        if ws_code.code_id in ws_code_to_raw_field_map:
-                            rqa_moves[(i, plan.raw_field)] = ws_code_to_raw_field_map[ws_code.code_id]
-                        else:
-                            if (ws_code.code_id, ws_code.display_text) not in unknown_target_code_counts:
-                                unknown_target_code_counts[(ws_code.code_id, ws_code.display_text)] = 0
-                            unknown_target_code_counts[(ws_code.code_id, ws_code.display_text)] += 1
-                            rqa_moves[(i, plan.raw_field)] = None
-
-            # Build a dictionary of the survey fields that haven't been moved, and cleared fields for those which have.
-            survey_updates = dict()  # of raw_field -> updated value
-            for plan in PipelineConfiguration.SURVEY_CODING_PLANS:
-                if plan.coda_filename is None:
-                    continue
-
-                if plan.raw_field in survey_moves.keys():
-                    # Data is moving
-                    survey_updates[plan.raw_field] = []
-                elif plan.raw_field in td:
-                    # Data is not moving
-                    survey_updates[plan.raw_field] = [_WSUpdate(td[plan.raw_field], td[plan.time_field], plan.raw_field)]
-
-            # Build a list of the rqa fields that haven't been moved.
-            rqa_updates = []  # of (field, value)
-            for i, td in enumerate(group):
-                for plan in PipelineConfiguration.RQA_CODING_PLANS:
-                    if plan.coda_filename is None:
-                        continue
-
-                    if plan.raw_field in td:
-                        if (i, plan.raw_field) in rqa_moves.keys():
-                            # Data is moving
-                            pass
-                        else:
-                            # Data is not moving
-                            rqa_updates.append((plan.raw_field, _WSUpdate(td[plan.raw_field], td[plan.time_field], plan.raw_field)))
-
-            # Add data moving from survey fields to the relevant survey_/rqa_updates
-            raw_survey_fields = {plan.raw_field for plan in PipelineConfiguration.SURVEY_CODING_PLANS}
-            raw_rqa_fields = {plan.raw_field for plan in PipelineConfiguration.RQA_CODING_PLANS}
-            for plan in PipelineConfiguration.SURVEY_CODING_PLANS + PipelineConfiguration.RQA_CODING_PLANS:
-                if plan.raw_field not in survey_moves:
-                    continue
-                    
-                target_field = survey_moves[plan.raw_field]
-                if target_field is None:
-                    continue
-                    
-                update = _WSUpdate(td[plan.raw_field], td[plan.time_field], plan.raw_field)
-                if target_field in raw_survey_fields:
-                    survey_updates[target_field] = survey_updates.get(target_field, []) + [update]
-                else:
-                    assert target_field in raw_rqa_fields, f"Raw field '{target_field}' not in any coding plan"
-                    rqa_updates.append((target_field, update))
-
-            # Add data moving from RQA fields to the relevant survey_/rqa_updates
-            for (i, source_field), target_field in rqa_moves.items():
-                if target_field is None:
-                    continue
-
-                for plan in PipelineConfiguration.SURVEY_CODING_PLANS + PipelineConfiguration.RQA_CODING_PLANS:
-                    if plan.raw_field == source_field:
-                        _td = group[i]
-                        update = _WSUpdate(_td[plan.raw_field], _td[plan.time_field], plan.raw_field)
-                        if target_field in raw_survey_fields:
-                            survey_updates[target_field] = survey_updates.get(target_field, []) + [update]
-                        else:
-                            assert target_field in raw_rqa_fields, f"Raw field '{target_field}' not in any coding plan"
-                            rqa_updates.append((target_field, update))
-
-            # Re-format the survey updates to a form suitable for use by the rest of the pipeline
-            flattened_survey_updates = {}
-            for plan in PipelineConfiguration.SURVEY_CODING_PLANS:
-                if plan.raw_field in survey_updates:
-                    plan_updates = survey_updates[plan.raw_field]
-
-                    if len(plan_updates) > 0:
-                        flattened_survey_updates[plan.raw_field] = "; ".join([u.message for u in plan_updates])
-                        flattened_survey_updates[plan.time_field] = sorted([u.timestamp for u in plan_updates])[0]
-                        flattened_survey_updates[f"{plan.raw_field}_source"] = "; ".join([u.source for u in plan_updates])
-                    else:
-                        flattened_survey_updates[plan.raw_field] = None
-                        flattened_survey_updates[plan.time_field] = None
-                        flattened_survey_updates[f"{plan.raw_field}_source"] = None
-
-            # Hide the survey keys currently in the TracedData which have had data moved away.
-            td.hide_keys({k for k, v in flattened_survey_updates.items() if v is None}.intersection(td.keys()),
-                         Metadata(user, Metadata.get_call_location(), time.time()))
-
-            # Update with the corrected survey data
-            td.append_data({k: v for k, v in flattened_survey_updates.items() if v is not None},
-                           Metadata(user, Metadata.get_call_location(), time.time()))
-
-            # Hide all the RQA fields (they will be added back, in turn, in the next step).
-            td.hide_keys({plan.raw_field for plan in PipelineConfiguration.RQA_CODING_PLANS}.intersection(td.keys()),
-                         Metadata(user, Metadata.get_call_location(), time.time()))
-            td.hide_keys({plan.time_field for plan in PipelineConfiguration.RQA_CODING_PLANS}.intersection(td.keys()),
-                         Metadata(user, Metadata.get_call_location(), time.time()))
-
-            # For each rqa message, create a copy of this td, append the rqa message, and add this to the
-            # list of TracedData.
-            raw_field_to_rqa_plan_map = {plan.raw_field: plan for plan in PipelineConfiguration.RQA_CODING_PLANS}
-            for target_field, update in rqa_updates:
-                target_coding_plan = raw_field_to_rqa_plan_map[target_field]
-
-                rqa_dict = {
-                    target_field: update.message,
-                    target_coding_plan.time_field: update.timestamp,
-                    f"{target_field}_source": update.source
-                }
-
-                corrected_td = td.copy()
-                corrected_td.append_data(rqa_dict, Metadata(user, Metadata.get_call_location(), time.time()))
-                corrected_data.append(corrected_td)
+        unknown_target_code_counts = Counter()  # 'WS - Correct Dataset' codes with no matching code id in any coding
+                                                # plan for this project, with a count of the occurrences
+        if processes == 1:
+            log.info("Performing WS correction...")
+            for group in data_grouped_by_uid.values():
+                corrected_data.extend(
+                    WSCorrection._correct_uid_group(user, group, plan_tables, unknown_target_code_counts))
+        else:
+            groups = list(data_grouped_by_uid.values())
+            chunks = [(user, groups[i:i + uid_groups_per_chunk])
+                      for i in range(0, len(groups), uid_groups_per_chunk)]
+            log.info(f"Performing WS correction on {len(groups)} uids in {len(chunks)} chunks, "
+                     f"using {processes} processes...")
+            with multiprocessing.Pool(processes, initializer=_init_ws_correction_worker) as pool:
+                # Pool.imap returns the results in the order of the chunks, so the output order is deterministic.
+                for chunk_corrected_data, chunk_unknown_target_code_counts in \
+                        pool.imap(_correct_uid_group_chunk, chunks):
+                    corrected_data.extend(chunk_corrected_data)
+                    unknown_target_code_counts.update(chunk_unknown_target_code_counts)
 
         if len(unknown_target_code_counts) > 0:
             log.warning("Found the following 'WS - Correct Dataset' CodeIDs with no matching coding plan:")
@@ -251,3 +174,144 @@ class WSCorrection(object):
                 log.warning(f"  '{code_id}' (DisplayText '{display_text}') ({count} occurrences)")
 
         return corrected_data
+
+    @staticmethod
+    def _correct_uid_group(user, group, plan_tables, unknown_target_code_counts):
+        """
+        Moves the WS data between the TracedData objects of a single uid.
+
+        :param user: Identifier of the user running this program, for TracedData Metadata.
+        :type user: str
+        :param group: All the TracedData objects for one uid.
+        :type group: list of TracedData
+        :param plan_tables: Plan lookup tables for this run.
+        :type plan_tables: _WSCorrectionPlanTables
+        :param unknown_target_code_counts: Counter of (code id, display text) of 'WS - Correct Dataset' codes with no
+                                           matching coding plan. Updated in place.
+        :type unknown_target_code_counts: collections.Counter
+        :return: TracedData objects for this uid with the WS data moved, one per RQA message.
+        :rtype: list of TracedData
+        """
+        def get_move_target(td, raw_field):
+            # Returns (whether the data in this raw_field is moving, the raw field it is moving to or None if unknown)
+            code_id = td[f"{raw_field}_WS_correct_dataset"]["CodeID"]
+            if code_id not in plan_tables.ws_code_id_to_target:
+                return False, None
+
+            target_field = plan_tables.ws_code_id_to_target[code_id]
+            if target_field is None:
+                unknown_target_code_counts[plan_tables.ws_code_id_to_display_key[code_id]] += 1
+            return True, target_field
+
+        # Find all the surveys data being moved.
+        # (Note: we only need to check one td in this group because all the demographics are the same)
+        td = group[0]
+        survey_moves = dict()  # of source_field -> target_field
+        for plan in plan_tables.survey_coda_plans:
+            if plan.raw_field not in td:
+                continue
+            is_moving, target_field = get_move_target(td, plan.raw_field)
+            if is_moving:
+                survey_moves[plan.raw_field] = target_field
+
+        # Find all the RQA data being moved, and build a list of the rqa fields that haven't been moved.
+        rqa_moves = []  # of (index in group, source_field, target_field)
+        rqa_updates = []  # of (field, value)
+        for i, td in enumerate(group):
+            for plan in plan_tables.rqa_coda_plans:
+                if plan.raw_field not in td:
+                    continue
+                is_moving, target_field = get_move_target(td, plan.raw_field)
+                if is_moving:
+                    # Data is moving
+                    rqa_moves.append((i, plan.raw_field, target_field))
+                else:
+                    # Data is not moving
+                    rqa_updates.append(
+                        (plan.raw_field, _WSUpdate(td[plan.raw_field], td[plan.time_field], plan.raw_field)))
+        # (Note: the rest of the correction for this group is applied to the last td in the group, whose survey data
+        #  is the same as the first's)
+        td = group[-1]
+
+        # Build a dictionary of the survey fields that haven't been moved, and cleared fields for those which have.
+        survey_updates = dict()  # of raw_field -> list of _WSUpdate
+        for plan in plan_tables.survey_coda_plans:
+            if plan.raw_field in survey_moves:
+                # Data is moving
+                survey_updates[plan.raw_field] = []
+            elif plan.raw_field in td:
+                # Data is not moving
+                survey_updates[plan.raw_field] = [_WSUpdate(td[plan.raw_field], td[plan.time_field], plan.raw_field)]
+
+        def add_moved_update(target_field, update):
+            if target_field in plan_tables.raw_survey_fields:
+                survey_updates.setdefault(target_field, []).append(update)
+            else:
+                assert target_field in plan_tables.raw_rqa_fields, f"Raw field '{target_field}' not in any coding plan"
+                rqa_updates.append((target_field, update))
+
+        # Add data moving from survey fields to the relevant survey_/rqa_updates
+        for source_field, target_field in survey_moves.items():
+            if target_field is None:
+                continue
+            plan = PipelineConfiguration.PLAN_REGISTRY.get_plan_by_raw_field(source_field)
+            add_moved_update(target_field, _WSUpdate(td[plan.raw_field], td[plan.time_field], plan.raw_field))
+
+        # Add data moving from RQA fields to the relevant survey_/rqa_updates
+        for i, source_field, target_field in rqa_moves:
+            if target_field is None:
+                continue
+            plan = PipelineConfiguration.PLAN_REGISTRY.get_plan_by_raw_field(source_field)
+            _td = group[i]
+            add_moved_update(target_field, _WSUpdate(_td[plan.raw_field], _td[plan.time_field], plan.raw_field))
+
+        # Re-format the survey updates to a form suitable for use by the rest of the pipeline
+        flattened_survey_updates = {}
+        for plan in plan_tables.survey_plans:
+            if plan.raw_field in survey_updates:
+                plan_updates = survey_updates[plan.raw_field]
+
+                if len(plan_updates) > 0:
+                    flattened_survey_updates[plan.raw_field] = "; ".join([u.message for u in plan_updates])
+                    flattened_survey_updates[plan.time_field] = min([u.timestamp for u in plan_updates])
+                    flattened_survey_updates[f"{plan.raw_field}_source"] = "; ".join([u.source for u in plan_updates])
+                else:
+                    flattened_survey_updates[plan.raw_field] = None
+                    flattened_survey_updates[plan.time_field] = None
+                    flattened_survey_updates[f"{plan.raw_field}_source"] = None
+
+        # Hide the survey keys currently in the TracedData which have had data moved away.
+        td.hide_keys({k for k, v in flattened_survey_updates.items() if v is None}.intersection(td.keys()),
+                     Metadata(user, Metadata.get_call_location(), time.time()))
+
+        # Update with the corrected survey data
+        td.append_data({k: v for k, v in flattened_survey_updates.items() if v is not None},
+                       Metadata(user, Metadata.get_call_location(), time.time()))
+
+        # Hide all the RQA fields (they will be added back, in turn, in the next step).
+        td.hide_keys(plan_tables.raw_rqa_fields.intersection(td.keys()),
+                     Metadata(user, Metadata.get_call_location(), time.time()))
+        td.hide_keys(plan_tables.rqa_time_fields.intersection(td.keys()),
+                     Metadata(user, Metadata.get_call_location(), time.time()))
+
+        # For each rqa message, create a TracedData which extends this td with the rqa message, and add this to the
+        # list of TracedData.
+        # All of these TracedData reference a single, shared copy of this td's history as their previous state, and
+        # only store their own rqa message on top of it. This is equivalent to copying the td and appending the rqa
+        # message for each one, but without holding a full copy of the history per rqa message.
+        shared_td = td.copy()
+        corrected_data = []
+        for target_field, update in rqa_updates:
+            target_coding_plan = plan_tables.raw_field_to_rqa_plan[target_field]
+
+            rqa_dict = {
+                target_field: update.message,
+                target_coding_plan.time_field: update.timestamp,
+                f"{target_field}_source": update.source
+            }
+
+            corrected_td = TracedData(rqa_dict, Metadata(user, Metadata.get_call_location(), time.time()),
+                                      _prev=shared_td)
+            corrected_data.append(corrected_td)
+
+        return corrected_data
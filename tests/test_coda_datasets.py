@@ -0,0 +1,105 @@
+import json
+import shutil
+import tempfile
+import time
+import unittest
+from os import path
+
+from core_data_modules.cleaners import Codes
+from core_data_modules.data_models import CodeScheme
+from core_data_modules.traced_data import Metadata, TracedData
+
+from src.lib.coda_datasets import CodaDatasets, MANUALLY_UNCODED_CODE_ID
+
+SCHEME = CodeScheme.from_firebase_map({
+    "SchemeID": "Scheme-s01",
+    "Name": "s01",
+    "Version": "0.0.0.1",
+    "Codes": [
+        {"CodeID": "code-yes", "CodeType": "Normal", "DisplayText": "yes", "StringValue": "yes", "NumericValue": 1,
+         "VisibleInCoda": True},
+        {"CodeID": "code-no", "CodeType": "Normal", "DisplayText": "no", "StringValue": "no", "NumericValue": 2,
+         "VisibleInCoda": True},
+        {"CodeID": "code-NR", "CodeType": "Control", "ControlCode": Codes.NOT_REVIEWED, "DisplayText": "NR",
+         "StringValue": "NR", "NumericValue": -30, "VisibleInCoda": False}
+    ]
+})
+
+
+def make_label(scheme_id, code_id, date_time_utc, checked=True):
+    return {
+        "SchemeID": scheme_id,
+        "CodeID": code_id,
+        "DateTimeUTC": date_time_utc,
+        "Checked": checked,
+        "Origin": {"OriginID": "test-coder", "Name": "Test Coder", "OriginType": "Manual"}
+    }
+
+
+def make_messages(message_ids):
+    return [TracedData({"id": message_id}, Metadata("test_user", Metadata.get_call_location(), time.time()))
+            for message_id in message_ids]
+
+
+class TestCodaDatasets(unittest.TestCase):
+    def setUp(self):
+        self.coda_input_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.coda_input_dir)
+
+    def write_coda_file(self, coda_filename, labels_by_message_id):
+        # Coda stores the labels for each message newest first.
+        with open(path.join(self.coda_input_dir, coda_filename), "w") as f:
+            json.dump([{"MessageID": message_id, "Text": "", "CreationDateTimeUTC": "2020-01-01T00:00:00+00:00",
+                        "Labels": labels} for message_id, labels in labels_by_message_id.items()], f)
+
+    def test_import_labels_falls_back_to_not_reviewed(self):
+        self.write_coda_file("s01.json", {
+            "checked": [make_label(SCHEME.scheme_id, "code-yes", "2020-01-02T00:00:00+00:00")],
+            "unchecked": [make_label(SCHEME.scheme_id, "code-yes", "2020-01-02T00:00:00+00:00", checked=False)],
+            "uncoded": [make_label(SCHEME.scheme_id, MANUALLY_UNCODED_CODE_ID, "2020-01-03T00:00:00+00:00"),
+                        make_label(SCHEME.scheme_id, "code-no", "2020-01-02T00:00:00+00:00")],
+            "no-labels": []
+        })
+        data = make_messages(["checked", "unchecked", "uncoded", "no-labels", "not-in-coda"])
+
+        CodaDatasets(self.coda_input_dir).import_labels_to_traced_data_iterable(
+            "test_user", data, "id", "s01.json", {"s01_coded": SCHEME})
+
+        self.assertEqual([td["s01_coded"]["CodeID"] for td in data],
+                         ["code-yes", "code-NR", "code-NR", "code-NR", "code-NR"])
+
+    def test_import_labels_multi_coded_merges_duplicated_schemes_in_time_order(self):
+        self.write_coda_file("s01.json", {
+            "message": [
+                make_label(f"{SCHEME.scheme_id}-1", "code-yes", "2020-01-03T00:00:00+00:00"),
+                make_label(SCHEME.scheme_id, "code-no", "2020-01-02T00:00:00+00:00"),
+                make_label(f"{SCHEME.scheme_id}-2", MANUALLY_UNCODED_CODE_ID, "2020-01-01T00:00:00+00:00")
+            ],
+            "unchecked": [make_label(SCHEME.scheme_id, "code-no", "2020-01-02T00:00:00+00:00", checked=False)]
+        })
+        data = make_messages(["message", "unchecked"])
+
+        CodaDatasets(self.coda_input_dir).import_labels_to_traced_data_iterable_multi_coded(
+            "test_user", data, "id", "s01.json", {"s01_coded": SCHEME})
+
+        self.assertEqual([(label["SchemeID"], label["CodeID"]) for label in data[0]["s01_coded"]],
+                         [(SCHEME.scheme_id, "code-no"), (f"{SCHEME.scheme_id}-1", "code-yes")])
+        self.assertEqual([label["CodeID"] for label in data[1]["s01_coded"]], ["code-NR"])
+
+    def test_missing_coda_file(self):
+        coda_datasets = CodaDatasets(self.coda_input_dir)
+        data = make_messages(["message"])
+
+        with self.assertRaises(FileNotFoundError):
+            coda_datasets.import_labels_to_traced_data_iterable(
+                "test_user", data, "id", "missing.json", {"s01_coded": SCHEME})
+
+        coda_datasets.import_labels_to_traced_data_iterable(
+            "test_user", data, "id", "missing.json", {"s01_coded": SCHEME}, missing_ok=True)
+        self.assertEqual(data[0]["s01_coded"]["CodeID"], "code-NR")
+
+        # Treating the file as missing once must not stop it from being reported as missing later.
+        with self.assertRaises(FileNotFoundError):
+            coda_datasets.get_latest_labels_index("missing.json")
@@ -0,0 +1,141 @@
+import random
+import time
+import unittest
+
+from core_data_modules.cleaners import Codes
+from core_data_modules.data_models import CodeScheme
+from core_data_modules.traced_data import Metadata, TracedData
+from core_data_modules.traced_data.util import FoldTracedData
+
+from src.lib import FoldTools
+
+EQUAL_KEYS = ["uid", "gender", "age"]
+CONCAT_KEYS = ["rqa_s01_raw", "rqa_s02_raw"]
+MATRIX_KEYS = [f"rqa_reasons_{i}" for i in range(10)]
+BOOL_KEYS = ["consent_withdrawn"]
+BINARY_KEYS = ["have_voice"]
+
+REASONS_SCHEME = CodeScheme.from_firebase_map({
+    "SchemeID": "Scheme-reasons",
+    "Name": "reasons",
+    "Version": "0.0.0.1",
+    "Codes": [
+        {"CodeID": "code-cost", "CodeType": "Normal", "DisplayText": "cost", "StringValue": "cost",
+         "NumericValue": 1, "VisibleInCoda": True},
+        {"CodeID": "code-NA", "CodeType": "Control", "ControlCode": Codes.TRUE_MISSING, "DisplayText": "NA",
+         "StringValue": "NA", "NumericValue": -10, "VisibleInCoda": False},
+        {"CodeID": "code-NC", "CodeType": "Control", "ControlCode": Codes.NOT_CODED, "DisplayText": "NC",
+         "StringValue": "NC", "NumericValue": -20, "VisibleInCoda": False}
+    ]
+})
+COST, NA, NC = 0b001, 0b010, 0b100
+
+
+def make_messages(seed, messages=2000, uids=500):
+    """
+    :return: Synthetic messages from `uids` respondents, with values for every kind of fold key, including missing and
+             None values, and some keys which are not folded.
+    :rtype: list of TracedData
+    """
+    rng = random.Random(seed)
+    data = []
+    for i in range(messages):
+        uid = rng.randrange(uids)
+        d = {
+            "uid": f"uid-{uid}",
+            "gender": ["male", "female", None][uid % 3],
+            "consent_withdrawn": Codes.TRUE if rng.random() < 0.02 else Codes.FALSE,
+            "sent_on": f"2020-01-01T00:00:{i % 60:02}+00:00"
+        }
+        if uid % 4 != 0:
+            d["age"] = str(uid % 50)
+        raw_field = rng.choice(CONCAT_KEYS)
+        d[raw_field] = rng.choice(["hello", "", "message", None])
+        for key in MATRIX_KEYS:
+            if rng.random() < 0.9:
+                d[key] = Codes.MATRIX_1 if rng.random() < 0.1 else Codes.MATRIX_0
+        d["have_voice"] = rng.choice([Codes.YES, Codes.NO, Codes.AMBIVALENT, Codes.NOT_CODED, Codes.TRUE_MISSING,
+                                      None])
+        data.append(TracedData(d, Metadata("test", Metadata.get_call_location(), time.time())))
+    return data
+
+
+class TestFoldTools(unittest.TestCase):
+    def test_fold_iterable_of_traced_data_matches_pairwise_fold(self):
+        for seed in range(5):
+            expected = FoldTracedData.fold_iterable_of_traced_data(
+                "test", [td.copy() for td in make_messages(seed)], lambda td: td["uid"],
+                equal_keys=EQUAL_KEYS, concat_keys=CONCAT_KEYS, matrix_keys=MATRIX_KEYS, bool_keys=BOOL_KEYS,
+                binary_keys=BINARY_KEYS
+            )
+            folded = FoldTools.fold_iterable_of_traced_data(
+                "test", [td.copy() for td in make_messages(seed)], lambda td: td["uid"],
+                equal_keys=EQUAL_KEYS, concat_keys=CONCAT_KEYS, matrix_keys=MATRIX_KEYS, bool_keys=BOOL_KEYS,
+                binary_keys=BINARY_KEYS
+            )
+
+            self.assertEqual(len(folded), len(expected))
+            for folded_td, expected_td in zip(folded, expected):
+                self.assertEqual(dict(folded_td), dict(expected_td))
+
+    def test_fold_iterable_of_traced_data_does_not_modify_its_input(self):
+        data = make_messages(0)
+        expected = [dict(td) for td in data]
+
+        FoldTools.fold_iterable_of_traced_data(
+            "test", data, lambda td: td["uid"],
+            equal_keys=EQUAL_KEYS, concat_keys=CONCAT_KEYS, matrix_keys=MATRIX_KEYS, bool_keys=BOOL_KEYS,
+            binary_keys=BINARY_KEYS
+        )
+
+        self.assertEqual([dict(td) for td in data], expected)
+
+    def test_fold_iterable_of_traced_data_copies_groups_of_one(self):
+        data = make_messages(0, messages=1, uids=1)
+
+        folded = FoldTools.fold_iterable_of_traced_data(
+            "test", data, lambda td: td["uid"],
+            equal_keys=EQUAL_KEYS, concat_keys=CONCAT_KEYS, matrix_keys=MATRIX_KEYS, bool_keys=BOOL_KEYS,
+            binary_keys=BINARY_KEYS
+        )
+
+        self.assertEqual(len(folded), 1)
+        self.assertIsNot(folded[0], data[0])
+        self.assertEqual(dict(folded[0]), dict(data[0]))
+
+    def test_fold_iterable_of_traced_data_hides_keys_which_are_not_folded(self):
+        data = [
+            TracedData({"uid": "a", "gender": "male", "rqa_s01_raw": "hello", "sent_on": "2020-01-01T00:00:00+00:00"},
+                       Metadata("test", Metadata.get_call_location(), time.time())),
+            TracedData({"uid": "a", "gender": "male", "sent_on": "2020-01-02T00:00:00+00:00"},
+                       Metadata("test", Metadata.get_call_location(), time.time()))
+        ]
+
+        folded = FoldTools.fold_iterable_of_traced_data("test", data, lambda td: td["uid"],
+                                                        equal_keys=["uid", "gender"], concat_keys=["rqa_s01_raw"])
+
+        self.assertEqual([dict(td) for td in folded], [{"uid": "a", "gender": "male", "rqa_s01_raw": "hello"}])
+
+    def test_fold_iterable_of_traced_data_folds_bitsets(self):
+        data = [TracedData({"uid": "a", "bitset": bitset}, Metadata("test", Metadata.get_call_location(), time.time()))
+                for bitset in [0b001, 0b100, None]]
+
+        folded = FoldTools.fold_iterable_of_traced_data("test", data, lambda td: td["uid"], equal_keys=["uid"],
+                                                        bitset_keys=["bitset"])
+
+        self.assertEqual([dict(td) for td in folded], [{"uid": "a", "bitset": 0b101}])
+
+    def test_fold_matrix_bitset_values_corrects_control_codes(self):
+        # NA is only kept if none of the messages being folded had a raw value.
+        self.assertEqual(FoldTools.fold_matrix_bitset_values(REASONS_SCHEME, [NA, COST], "hello"), COST)
+        self.assertEqual(FoldTools.fold_matrix_bitset_values(REASONS_SCHEME, [NA, NA], None), NA)
+        self.assertEqual(FoldTools.fold_matrix_bitset_values(REASONS_SCHEME, [NA, NA], ""), NA)
+
+        # NC is set if no other code is.
+        self.assertEqual(FoldTools.fold_matrix_bitset_values(REASONS_SCHEME, [NA, NC], "hello"), NC)
+        self.assertEqual(FoldTools.fold_matrix_bitset_values(REASONS_SCHEME, [0, None], "hello"), NC)
+        self.assertEqual(FoldTools.fold_matrix_bitset_values(REASONS_SCHEME, [NC, COST], "hello"), NC | COST)
+
+    def test_fold_equal_values_rejects_different_values(self):
+        with self.assertRaises(AssertionError):
+            FoldTools.fold_equal_values("age", ["20", "21"])
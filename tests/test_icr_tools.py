@@ -0,0 +1,39 @@
+import random
+import unittest
+
+from src.lib import ICRTools, ReservoirSampler
+
+
+class TestICRTools(unittest.TestCase):
+    def test_generate_sample_for_icr_is_reproducible(self):
+        # The ICR sample for a fixed seed and input is pinned, so that a change to the sampling algorithm which would
+        # change the messages exported for ICR is caught.
+        sample = ICRTools.generate_sample_for_icr(range(1000), 10, random.Random(0))
+        self.assertEqual(sample, [819, 785, 2, 930, 506, 179, 925, 790, 746, 329])
+
+        self.assertEqual(ICRTools.generate_sample_for_icr(range(1000), 10, random.Random(0)), sample)
+
+    def test_generate_sample_for_icr_accepts_an_iterator(self):
+        self.assertEqual(
+            ICRTools.generate_sample_for_icr(iter(range(1000)), 10, random.Random(0)),
+            ICRTools.generate_sample_for_icr(list(range(1000)), 10, random.Random(0))
+        )
+
+    def test_generate_sample_for_icr_returns_all_of_small_data(self):
+        self.assertEqual(ICRTools.generate_sample_for_icr(["a", "b", "c"], 10, random.Random(0)), ["a", "b", "c"])
+
+
+class TestReservoirSampler(unittest.TestCase):
+    def test_sample_is_uniform(self):
+        # Each of 10 items sampled 3 at a time should be drawn 30% of the time.
+        rng = random.Random(0)
+        counts = [0] * 10
+        for _ in range(10000):
+            sampler = ReservoirSampler(3, rng)
+            for item in range(10):
+                sampler.add(item)
+            for item in sampler.get_sample():
+                counts[item] += 1
+
+        for count in counts:
+            self.assertAlmostEqual(count / 10000, 0.3, delta=0.02)